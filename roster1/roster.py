@@ -31,41 +31,62 @@ num_shifts = 5
 max_staff = 6
 min_staff = 5
 
-model = cp_model.CpModel()
-
-
-shift_vars = {}
-shift_vars = {
-    (staff_member, group, shift): model.NewBoolVar(
-        f"{staff_member}_group{group}_shift{shift}"
-    )
-    for staff_member in staff
-    for group in staff[staff_member]
-    for shift in range(num_shifts)
-}
-
-
-#  Maximum and minimum staff per shift
-for shift in range(num_shifts):
-    shifts = [
-        shift_vars[(staff_member, group, shift)]
+# Days per roster
+days_per_roster = {1: 3, 2: 2, 3: 2, 4: 2, 5: 1}
+# Schedule group 6 together for 1 day
+groups_together = {6: 1}
+supervisors = {3: ("Mike", "Belinda")}
+# Order shifts of staff in the same groups to avoid equivalent rosters
+symmetry_breaking = True
+
+# Solver settings, None uses the solver default
+num_workers = 0
+max_time_in_seconds = 60.0
+random_seed = None
+log_search_progress = False
+
+
+def create_shift_vars(model, staff, num_shifts):
+    """Create shift variables."""
+    shift_vars = {
+        (staff_member, group, shift): model.NewBoolVar(
+            f"{staff_member}_group{group}_shift{shift}"
+        )
         for staff_member in staff
         for group in staff[staff_member]
-    ]
-    model.Add(sum(shifts) <= max_staff)
-    model.Add(sum(shifts) >= min_staff)
+        for shift in range(num_shifts)
+    }
+    return shift_vars
 
 
-# Maximum one shift per person per day
-for staff_member in staff:
+def enforce_staff_per_shift(
+    model, shift_vars, staff, num_shifts, min_staff, max_staff
+):
+    """Maximum and minimum staff per shift."""
     for shift in range(num_shifts):
         shifts = [
-            shift_vars[(staff_member, group, shift)] for group in staff[staff_member]
+            shift_vars[(staff_member, group, shift)]
+            for staff_member in staff
+            for group in staff[staff_member]
         ]
-        model.Add(sum(shifts) <= 1)
+        model.Add(sum(shifts) <= max_staff)
+        model.Add(sum(shifts) >= min_staff)
+
+
+def enforce_one_shift_per_day(model, shift_vars, staff, num_shifts):
+    """Maximum one shift per person per day."""
+    for staff_member in staff:
+        for shift in range(num_shifts):
+            shifts = [
+                shift_vars[(staff_member, group, shift)]
+                for group in staff[staff_member]
+            ]
+            model.Add(sum(shifts) <= 1)
 
 
-def enforce_days_per_roster(group, days_per_roster):
+def enforce_days_per_roster(
+    model, shift_vars, staff, num_shifts, group, days_per_roster
+):
     for staff_member in staff:
         if group in staff[staff_member]:
             shifts = [
@@ -76,15 +97,9 @@ def enforce_days_per_roster(group, days_per_roster):
             model.Add(sum(shifts) == days_per_roster)
 
 
-# Days per roster
-enforce_days_per_roster(group=1, days_per_roster=3)
-enforce_days_per_roster(group=2, days_per_roster=2)
-enforce_days_per_roster(group=3, days_per_roster=2)
-enforce_days_per_roster(group=4, days_per_roster=2)
-enforce_days_per_roster(group=5, days_per_roster=1)
-
-
-def enforce_group_together(group, days_per_roster):
+def enforce_group_together(
+    model, shift_vars, staff, num_shifts, group, days_per_roster
+):
     intermediate_shift_vars = [
         model.NewBoolVar(f"shift{shift}") for shift in range(num_shifts)
     ]
@@ -104,11 +119,7 @@ def enforce_group_together(group, days_per_roster):
         )
 
 
-# Schedule group 6 together for 1 day
-enforce_group_together(group=6, days_per_roster=1)
-
-
-def enforce_supervisor(group, supervisors):
+def enforce_supervisor(model, shift_vars, staff, num_shifts, group, supervisors):
     group_staff = []
     for staff_member in staff:
         if group in staff[staff_member]:
@@ -125,28 +136,145 @@ def enforce_supervisor(group, supervisors):
             )
 
 
-enforce_supervisor(group=3, supervisors=("Mike", "Belinda"))
+def get_interchangeable_staff(staff, supervisors):
+    """Get groups of staff in the same groups who are not supervisors."""
+    named_staff = {
+        supervisor
+        for group_supervisors in supervisors.values()
+        for supervisor in group_supervisors
+    }
+    groups = {}
+    for staff_member in staff:
+        if staff_member not in named_staff:
+            groups.setdefault(tuple(staff[staff_member]), []).append(
+                staff_member
+            )
+    return [group for group in groups.values() if len(group) > 1]
+
+
+def enforce_lexicographic_order(model, larger_vars, smaller_vars, name):
+    """Enforce boolean variables are lexicographically ordered."""
+    prefix_equal = model.NewConstant(1)
+    for position, (larger_var, smaller_var) in enumerate(
+        zip(larger_vars, smaller_vars)
+    ):
+        next_prefix_equal = model.NewBoolVar(f"{name}_prefix_equal{position}")
+        model.Add(larger_var >= smaller_var).OnlyEnforceIf(prefix_equal)
+        model.AddBoolOr(
+            [
+                prefix_equal.Not(),
+                larger_var.Not(),
+                smaller_var.Not(),
+                next_prefix_equal,
+            ]
+        )
+        model.AddBoolOr(
+            [prefix_equal.Not(), larger_var, smaller_var, next_prefix_equal]
+        )
+        model.AddImplication(next_prefix_equal, prefix_equal)
+        model.Add(larger_var == smaller_var).OnlyEnforceIf(next_prefix_equal)
+        prefix_equal = next_prefix_equal
+
+
+def enforce_symmetry_breaking(model, shift_vars, staff, num_shifts, supervisors):
+    """Order shifts of interchangeable staff."""
+    for interchangeable_staff in get_interchangeable_staff(staff, supervisors):
+        for larger_staff_member, smaller_staff_member in zip(
+            interchangeable_staff, interchangeable_staff[1:]
+        ):
+            enforce_lexicographic_order(
+                model,
+                [
+                    shift_vars[(larger_staff_member, group, shift)]
+                    for shift in range(num_shifts)
+                    for group in staff[larger_staff_member]
+                ],
+                [
+                    shift_vars[(smaller_staff_member, group, shift)]
+                    for shift in range(num_shifts)
+                    for group in staff[smaller_staff_member]
+                ],
+                f"{larger_staff_member}_over_{smaller_staff_member}",
+            )
 
 
-# Solve
-solver = cp_model.CpSolver()
-solution_status = solver.Solve(model)
-if solution_status == cp_model.INFEASIBLE:
-    log.info("Solution is INFEASIBLE")
-if solution_status == cp_model.MODEL_INVALID:
-    log.info("Solution is MODEL_INVALID")
-if solution_status == cp_model.UNKNOWN:
-    log.info("Solution is UNKNOWN")
-if solution_status != cp_model.FEASIBLE and solution_status != cp_model.OPTIMAL:
-    log.info("No feasible solution, raising exception...")
-    raise SolutionNotFeasible("No feasible solutions.")
+def build_model(
+    staff,
+    num_shifts,
+    max_staff,
+    min_staff,
+    days_per_roster,
+    groups_together,
+    supervisors,
+    symmetry_breaking=True,
+):
+    """Build model."""
+    model = cp_model.CpModel()
+    shift_vars = create_shift_vars(model, staff, num_shifts)
+    enforce_staff_per_shift(
+        model, shift_vars, staff, num_shifts, min_staff, max_staff
+    )
+    enforce_one_shift_per_day(model, shift_vars, staff, num_shifts)
+    for group, days in days_per_roster.items():
+        enforce_days_per_roster(model, shift_vars, staff, num_shifts, group, days)
+    for group, days in groups_together.items():
+        enforce_group_together(model, shift_vars, staff, num_shifts, group, days)
+    for group, group_supervisors in supervisors.items():
+        enforce_supervisor(
+            model, shift_vars, staff, num_shifts, group, group_supervisors
+        )
+    if symmetry_breaking:
+        enforce_symmetry_breaking(model, shift_vars, staff, num_shifts, supervisors)
+    return model, shift_vars
+
+
+def solve(model):
+    """Solve model."""
+    solver = cp_model.CpSolver()
+    solver.parameters.num_workers = num_workers
+    solver.parameters.max_time_in_seconds = max_time_in_seconds
+    if random_seed is not None:
+        solver.parameters.random_seed = random_seed
+    solver.parameters.log_search_progress = log_search_progress
+    solution_status = solver.Solve(model)
+    if solution_status == cp_model.INFEASIBLE:
+        log.info("Solution is INFEASIBLE")
+    if solution_status == cp_model.MODEL_INVALID:
+        log.info("Solution is MODEL_INVALID")
+    if solution_status == cp_model.UNKNOWN:
+        log.info("Solution is UNKNOWN")
+    if solution_status != cp_model.FEASIBLE and solution_status != cp_model.OPTIMAL:
+        log.info("No feasible solution, raising exception...")
+        raise SolutionNotFeasible("No feasible solutions.")
+    return solver
+
+
+def display_shifts(staff, num_shifts, shift_vars, solver):
+    """Display shifts."""
+    for shift in range(num_shifts):
+        print(f"Day{shift + 1}: ", end="")
+        for staff_member in staff:
+            for group in staff[staff_member]:
+                if solver.Value(shift_vars[(staff_member, group, shift)]) == 1:
+                    print(f"{staff_member} ", end="")
+        print()
+
+
+def main():
+    """Run main program."""
+    model, shift_vars = build_model(
+        staff,
+        num_shifts,
+        max_staff,
+        min_staff,
+        days_per_roster,
+        groups_together,
+        supervisors,
+        symmetry_breaking,
+    )
+    solver = solve(model)
+    display_shifts(staff, num_shifts, shift_vars, solver)
 
 
-# Display shifts
-for shift in range(num_shifts):
-    print(f"Day{shift + 1}: ", end="")
-    for staff_member in staff:
-        for group in staff[staff_member]:
-            if solver.Value(shift_vars[(staff_member, group, shift)]) == 1:
-                print(f"{staff_member} ", end="")
-    print()
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+"""Solver parameter autotuning for mini roster 2.
+
+Each candidate solver profile from a grid or random search is run on
+every instance of a corpus, by default data.py and synthetic instances
+of several sizes and role structures, with fixed random seeds and a
+time budget.
+Profiles are ranked by median time to an optimal roster, or to a target
+objective, with runs that miss it counted as PENALTY_FACTOR times the
+budget. The best profile can be saved by name for --solver-profile.
+"""
+import argparse
+import json
+import logging
+import random
+import statistics
+from itertools import product
+
+from builder import get_default_instance
+from loader import load_instance
+from logic import IncumbentCallback, create_solver, save_solver_profile
+from model_cache import build_model_cached
+from roster import add_model_arguments, setup_logging
+from synthetic import generate_instance
+
+log = logging.getLogger("roster")
+
+# Candidate values of CP-SAT SatParameters fields, enums by name
+PARAMETER_GRID = {
+    "num_workers": [1, 4, 8],
+    "search_branching": [
+        "AUTOMATIC_SEARCH",
+        "FIXED_SEARCH",
+        "PORTFOLIO_SEARCH",
+    ],
+    "linearization_level": [0, 1, 2],
+    "cp_model_presolve": [True, False],
+}
+
+PENALTY_FACTOR = 2
+
+# generate_instance options of synthetic corpus instances, used in turn
+SYNTHETIC_OPTIONS = (
+    {"num_staff": 12},
+    {"num_staff": 20, "num_roles": 2, "multi_role_fraction": 0.2},
+    {"num_staff": 30, "num_weekday_shifts": 4, "num_weekend_shifts": 3},
+    {
+        "num_staff": 40,
+        "num_weekday_shifts": 6,
+        "num_weekend_shifts": 4,
+        "num_roles": 3,
+        "multi_role_fraction": 0.2,
+    },
+)
+
+
+def get_synthetic_corpus(num_instances, seed=0):
+    """Get synthetic instances of varying size and role structure.
+
+    Instances cycle through SYNTHETIC_OPTIONS, each with its own seed.
+    """
+    corpus = []
+    for num in range(num_instances):
+        options = SYNTHETIC_OPTIONS[num % len(SYNTHETIC_OPTIONS)]
+        instance = generate_instance(**options, seed=seed + num)
+        corpus.append(
+            (
+                f"synthetic{num + 1}_{len(instance['staff'])}staff_"
+                f"{len(instance['shifts'])}shifts",
+                instance,
+            )
+        )
+    return corpus
+
+
+def get_candidate_profiles(
+    parameter_grid, search="grid", num_samples=10, seed=0
+):
+    """Get solver profiles to try from a grid of parameter values.
+
+    A grid search tries every combination, a random search a sample of
+    num_samples of them.
+    """
+    parameters = list(parameter_grid)
+    profiles = [
+        dict(zip(parameters, values))
+        for values in product(*parameter_grid.values())
+    ]
+    if search == "random" and num_samples < len(profiles):
+        profiles = random.Random(seed).sample(profiles, num_samples)
+    return profiles
+
+
+def time_solve(roster_model, solver_profile, max_time, target_objective):
+    """Time solving a roster model with a solver profile.
+
+    Returns seconds until the roster is proved optimal or, if
+    target_objective is given, until a roster at least that good is
+    found, or None if that does not happen within max_time.
+    """
+    solver = create_solver(
+        {**solver_profile, "max_time_in_seconds": max_time}
+    )
+    if target_objective is None:
+        solver.Solve(roster_model.model)
+        if solver.StatusName(solver.ResponseProto().status) == "OPTIMAL":
+            return solver.WallTime()
+        return None
+    target_times = []
+
+    def on_incumbent(callback):
+        if callback.ObjectiveValue() <= target_objective:
+            target_times.append(callback.WallTime())
+            callback.StopSearch()
+
+    solver.Solve(roster_model.model, IncumbentCallback(on_incumbent))
+    return target_times[0] if target_times else None
+
+
+def tune(
+    corpus,
+    profiles,
+    seeds=(0,),
+    max_time=10.0,
+    target_objective=None,
+    **build_options,
+):
+    """Rank solver profiles by median solve time over a corpus.
+
+    corpus is a list of (name, instance) pairs, built once each with
+    build_options. Returns a record per profile, best first.
+    """
+    roster_models = [
+        (name, build_model_cached(instance, **build_options))
+        for name, instance in corpus
+    ]
+    records = []
+    for solver_profile in profiles:
+        runs = []
+        for name, roster_model in roster_models:
+            for seed in seeds:
+                solve_time = time_solve(
+                    roster_model,
+                    {**solver_profile, "random_seed": seed},
+                    max_time,
+                    target_objective,
+                )
+                runs.append(
+                    {"instance": name, "seed": seed, "time": solve_time}
+                )
+        penalised_times = [
+            PENALTY_FACTOR * max_time if run["time"] is None else run["time"]
+            for run in runs
+        ]
+        record = {
+            "solver_profile": solver_profile,
+            "median_time": statistics.median(penalised_times),
+            "solved": sum(run["time"] is not None for run in runs),
+            "runs": runs,
+        }
+        log.info(
+            f"{solver_profile} median {record['median_time']:.3f}s, "
+            f"{record['solved']} of {len(runs)} solved"
+        )
+        records.append(record)
+    return sorted(
+        records, key=lambda record: (record["median_time"], -record["solved"])
+    )
+
+
+def display_ranking(records):
+    """Display solver profiles from best to worst."""
+    for rank, record in enumerate(records, start=1):
+        print(
+            f"{rank:3} {record['median_time']:8.3f}s "
+            f"{record['solved']:3}/{len(record['runs'])} "
+            f"{json.dumps(record['solver_profile'])}"
+        )
+
+
+if __name__ == "__main__":
+    setup_logging()
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--instance",
+        action="append",
+        default=[],
+        help="instance directory to add to the corpus, can be repeated",
+    )
+    parser.add_argument(
+        "--synthetic",
+        type=int,
+        default=4,
+        help="number of synthetic instances to add to the corpus",
+    )
+    parser.add_argument(
+        "--no-data",
+        action="store_true",
+        help="do not add the data.py instance to the corpus",
+    )
+    parser.add_argument(
+        "--parameters",
+        help="JSON file mapping solver parameters to candidate values",
+    )
+    parser.add_argument(
+        "--search",
+        choices=("grid", "random"),
+        default="grid",
+        help="try all parameter combinations or a random sample",
+    )
+    parser.add_argument(
+        "--samples",
+        type=int,
+        default=10,
+        help="number of combinations tried by a random search",
+    )
+    parser.add_argument(
+        "--seeds", type=int, default=1, help="solver random seeds per run"
+    )
+    parser.add_argument(
+        "--max-time",
+        type=float,
+        default=10.0,
+        help="solver time limit in seconds per run",
+    )
+    parser.add_argument(
+        "--target-objective",
+        type=int,
+        help="time finding a roster this good instead of proving optimality",
+    )
+    parser.add_argument(
+        "--save", help="save the best solver profile under this name"
+    )
+    parser.add_argument("--output", help="write rankings as JSON to this file")
+    add_model_arguments(parser)
+    args = parser.parse_args()
+    parameter_grid = PARAMETER_GRID
+    if args.parameters:
+        with open(args.parameters) as parameters_file:
+            parameter_grid = json.load(parameters_file)
+    corpus = [
+        (directory, load_instance(directory, args.fairness_days))
+        for directory in args.instance
+    ]
+    if not args.no_data:
+        corpus.append(("data", get_default_instance()))
+    corpus += get_synthetic_corpus(args.synthetic)
+    records = tune(
+        corpus,
+        get_candidate_profiles(parameter_grid, args.search, args.samples),
+        seeds=range(args.seeds),
+        max_time=args.max_time,
+        target_objective=args.target_objective,
+        sequence_engine=args.sequence_engine,
+        cache_dir=None if args.no_cache else args.cache_dir,
+        history_mode=args.history_mode,
+        symmetry_breaking=not args.no_symmetry_breaking,
+        fairness_days=args.fairness_days,
+        fairness_decay=args.fairness_decay,
+    )
+    display_ranking(records)
+    if args.save:
+        save_solver_profile(args.save, records[0]["solver_profile"])
+        log.info(f"Saved solver profile {args.save}")
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(records, output_file, indent=2)
@@ -0,0 +1,290 @@
+"""Scaling benchmarks for roster2 and roster1 style models.
+
+Each case generates a synthetic instance, builds and solves it in a fresh
+worker process and appends one JSON record per case to the output file.
+"""
+import argparse
+import importlib.util
+import json
+import logging
+import os
+import platform
+import resource
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import ortools
+
+from builder import build_model
+from cache import get_proto_size
+from logic import create_solver
+from roster import setup_logging
+from synthetic import generate_instance, scale_roster1_instance
+
+log = logging.getLogger("roster")
+
+ROSTER1_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "roster1", "roster.py"
+)
+
+ROSTER2_CASE_DEFAULTS = {
+    "num_staff": 9,
+    "num_days": 28,
+    "num_weekday_shifts": 3,
+    "num_weekend_shifts": 2,
+    "num_roles": 1,
+    "multi_role_fraction": 0.0,
+    "sequence_engine": "table",
+    "history_mode": "variables",
+    "symmetry_breaking": True,
+}
+
+ROSTER1_CASE_DEFAULTS = {"num_copies": 1, "num_periods": 1}
+
+
+def get_suite(name):
+    """Get benchmark cases for a named suite."""
+    cases = []
+    if name == "smoke":
+        for sequence_engine in ("table", "automaton", "blocks"):
+            for history_mode in ("variables", "constants"):
+                cases.append(
+                    {
+                        "model": "roster2",
+                        "sequence_engine": sequence_engine,
+                        "history_mode": history_mode,
+                    }
+                )
+        cases.append({"model": "roster1"})
+    elif name in ("scaling", "large"):
+        staff_counts = (9, 50, 200) if name == "scaling" else (200, 1000)
+        day_counts = (28, 84) if name == "scaling" else (84, 364)
+        for num_staff in staff_counts:
+            for num_days in day_counts:
+                for sequence_engine in ("table", "automaton", "blocks"):
+                    cases.append(
+                        {
+                            "model": "roster2",
+                            "num_staff": num_staff,
+                            "num_days": num_days,
+                            "sequence_engine": sequence_engine,
+                            "history_mode": "constants",
+                        }
+                    )
+        cases.append(
+            {
+                "model": "roster2",
+                "num_staff": staff_counts[-1],
+                "num_days": day_counts[0],
+                "num_weekday_shifts": 6,
+                "num_weekend_shifts": 4,
+                "num_roles": 3,
+                "multi_role_fraction": 0.2,
+                "sequence_engine": "automaton",
+                "history_mode": "constants",
+            }
+        )
+        for num_copies in (1, 10, 50) if name == "scaling" else (50, 200):
+            for num_periods in (1, 4):
+                cases.append(
+                    {
+                        "model": "roster1",
+                        "num_copies": num_copies,
+                        "num_periods": num_periods,
+                    }
+                )
+    else:
+        raise ValueError(f"Unknown benchmark suite: {name}")
+    return cases
+
+
+def get_model_size(model):
+    """Get number of variables, constraints and proto size of model."""
+    proto = model.Proto()
+    return {
+        "num_variables": len(proto.variables),
+        "num_constraints": len(proto.constraints),
+        **get_proto_size(model),
+    }
+
+
+def load_roster1():
+    """Load roster1 module, which shares its module name with roster2."""
+    spec = importlib.util.spec_from_file_location("roster1", ROSTER1_PATH)
+    roster1 = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(roster1)
+    return roster1
+
+
+def run_roster2_case(case, record):
+    """Build a roster2 case, returning the model and objective variable."""
+    instance = generate_instance(
+        case["num_staff"],
+        case["num_days"],
+        case["num_weekday_shifts"],
+        case["num_weekend_shifts"],
+        case["num_roles"],
+        case["multi_role_fraction"],
+        case["seed"],
+    )
+    num_sequences = len(instance["valid_shift_sequences"])
+    if (
+        case["sequence_engine"] == "table"
+        and num_sequences ** (case["num_days"] // 7) > case["max_table_rows"]
+    ):
+        record["status"] = "SKIPPED"
+        return None, None
+    start_time = time.perf_counter()
+    roster_model = build_model(
+        instance,
+        sequence_engine=case["sequence_engine"],
+        history_mode=case["history_mode"],
+        symmetry_breaking=case["symmetry_breaking"],
+    )
+    record["build_time"] = time.perf_counter() - start_time
+    record["build_stages"] = roster_model.build_report.stages
+    return roster_model.model, roster_model.max_unpleasant_shifts
+
+
+def run_roster1_case(case, record):
+    """Build a roster1 case, returning the model."""
+    roster1 = load_roster1()
+    base_instance = {
+        "staff": roster1.staff,
+        "num_shifts": roster1.num_shifts,
+        "max_staff": roster1.max_staff,
+        "min_staff": roster1.min_staff,
+        "days_per_roster": roster1.days_per_roster,
+        "groups_together": roster1.groups_together,
+        "supervisors": roster1.supervisors,
+    }
+    instance = scale_roster1_instance(
+        base_instance, case["num_copies"], case["num_periods"]
+    )
+    start_time = time.perf_counter()
+    model, shift_vars = roster1.build_model(**instance)
+    record["build_time"] = time.perf_counter() - start_time
+    return model, None
+
+
+def run_case(case, solver_profile):
+    """Run one benchmark case and return its record."""
+    record = {"case": case}
+    if case["model"] == "roster2":
+        model, objective_var = run_roster2_case(case, record)
+    else:
+        model, objective_var = run_roster1_case(case, record)
+    if model is not None:
+        record.update(get_model_size(model))
+        solver = create_solver(solver_profile)
+        start_time = time.perf_counter()
+        solution_status = solver.Solve(model)
+        record["solve_time"] = time.perf_counter() - start_time
+        record["status"] = solver.StatusName(solution_status)
+        if objective_var is not None and record["status"] in (
+            "OPTIMAL",
+            "FEASIBLE",
+        ):
+            record["objective"] = solver.Value(objective_var)
+            record["best_bound"] = solver.BestObjectiveBound()
+    # Linux reports kilobytes
+    record["peak_memory_kb"] = resource.getrusage(
+        resource.RUSAGE_SELF
+    ).ru_maxrss
+    return record
+
+
+def run_suite(cases, solver_profile, output_path):
+    """Run benchmark cases one at a time in fresh worker processes."""
+    environment = {
+        "ortools_version": ortools.__version__,
+        "python_version": platform.python_version(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "solver_profile": solver_profile,
+    }
+    records = []
+    with open(output_path, "a") as output_file:
+        for case in cases:
+            # Fresh process per case so peak memory is per case
+            with ProcessPoolExecutor(
+                max_workers=1, max_tasks_per_child=1
+            ) as executor:
+                try:
+                    record = executor.submit(
+                        run_case, case, solver_profile
+                    ).result()
+                except Exception as error:
+                    record = {
+                        "case": case,
+                        "status": "ERROR",
+                        "error": repr(error),
+                    }
+            record.update(environment)
+            log.info(
+                f"{case} {record['status']} "
+                f"build {record.get('build_time', 0):.3f}s "
+                f"solve {record.get('solve_time', 0):.3f}s"
+            )
+            output_file.write(json.dumps(record) + "\n")
+            output_file.flush()
+            records.append(record)
+    return records
+
+
+if __name__ == "__main__":
+    setup_logging()
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--suite",
+        choices=("smoke", "scaling", "large"),
+        default="smoke",
+        help="set of benchmark cases to run",
+    )
+    parser.add_argument(
+        "--output",
+        default="benchmark.jsonl",
+        help="JSON lines file results are appended to",
+    )
+    parser.add_argument(
+        "--max-time",
+        type=float,
+        default=60.0,
+        help="solver time limit in seconds per case",
+    )
+    parser.add_argument(
+        "--num-workers",
+        type=int,
+        default=8,
+        help="number of parallel search workers per case",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    parser.add_argument(
+        "--max-table-rows",
+        type=int,
+        default=10**6,
+        help="skip table engine cases with larger permutation tables",
+    )
+    args = parser.parse_args()
+    cases = [
+        {
+            **(
+                ROSTER2_CASE_DEFAULTS
+                if case["model"] == "roster2"
+                else ROSTER1_CASE_DEFAULTS
+            ),
+            **case,
+            "seed": args.seed,
+            "max_table_rows": args.max_table_rows,
+        }
+        for case in get_suite(args.suite)
+    ]
+    run_suite(
+        cases,
+        {
+            "num_workers": args.num_workers,
+            "max_time_in_seconds": args.max_time,
+            "random_seed": args.seed,
+        },
+        args.output,
+    )
@@ -0,0 +1,330 @@
+"""Build roster2 models from instance data."""
+import logging
+from ortools.sat.python import cp_model
+
+from compact import CompactInstance
+from instrumentation import BuildReport
+from logic import (
+    add_solution_hints,
+    configure_objective,
+    create_previous_shift_vars,
+    create_shift_vars,
+    create_skill_mix_vars,
+    create_work_vars,
+    enforce_completion_of_shift_segments,
+    enforce_one_skill_mix_rule_per_shift,
+    enforce_shift_sequence_blocks,
+    enforce_shift_sequences,
+    enforce_shift_sequences_automaton,
+    enforce_shifts_already_worked,
+    enforce_skill_mix_rules,
+    enforce_symmetry_breaking,
+    get_interchangeable_staff,
+    get_previous_unpleasant_shift_counts,
+    get_shift_sequence_blocks,
+    get_shift_sequence_automaton,
+    get_valid_shift_sequence_permutations,
+    get_work_var_indexes,
+)
+from shift_calendar import ShiftCalendar
+
+log = logging.getLogger("roster")
+
+SEQUENCE_ENGINES = ("table", "automaton", "blocks")
+HISTORY_MODES = ("variables", "constants")
+
+# Names of the inputs making up a roster instance, as defined in data.py
+INSTANCE_KEYS = (
+    "num_days",
+    "shifts",
+    "staff",
+    "shift_days",
+    "previous_shifts",
+    "valid_shift_sequences",
+    "skill_mix_rules",
+    "unpleasant_shifts",
+)
+
+DAYS_IN_PARTIAL_SEQUENCE = 7
+
+
+def get_default_instance():
+    """Get roster instance defined in data.py."""
+    import data
+
+    return {key: getattr(data, key) for key in INSTANCE_KEYS}
+
+
+class RosterModel:
+    """CP-SAT model for a roster instance and its variables."""
+
+    def __init__(
+        self,
+        instance,
+        model,
+        shift_calendar,
+        compact_instance,
+        shift_vars,
+        work_vars,
+        work_var_indexes,
+        skill_mix_vars,
+        max_unpleasant_shifts,
+        build_report=None,
+        previous_unpleasant_shift_counts=None,
+    ):
+        self.instance = instance
+        self.model = model
+        self.shift_calendar = shift_calendar
+        self.compact_instance = compact_instance
+        self.shift_vars = shift_vars
+        self.work_vars = work_vars
+        self.work_var_indexes = work_var_indexes
+        self.skill_mix_vars = skill_mix_vars
+        self.max_unpleasant_shifts = max_unpleasant_shifts
+        self.build_report = build_report
+        # Weighted unpleasant shifts before the roster period counted
+        # by the objective, by staff member
+        self.previous_unpleasant_shift_counts = (
+            previous_unpleasant_shift_counts
+        )
+
+
+def build_model(
+    instance,
+    sequence_engine="table",
+    cache_dir=None,
+    history_mode="variables",
+    hint_assignment=None,
+    symmetry_breaking=True,
+    fairness_days=None,
+    fairness_decay=1.0,
+):
+    """Build model for roster instance.
+
+    hint_assignment is an existing assignment of shifts per staff member
+    and day used to warm start the solver. With symmetry_breaking,
+    unpleasant shifts of interchangeable staff members are ordered, so
+    callers must not add constraints that treat them differently.
+    Fairness counts unpleasant shifts over the last fairness_days days
+    of previous_shifts, by default the previous period, with each
+    earlier period weighted by fairness_decay. The previous period is
+    always counted, so a ValueError is raised if fairness_days is less
+    than num_days. Statistics for each build stage are recorded in the
+    build report of the returned model.
+    """
+    num_days = instance["num_days"]
+    shifts = instance["shifts"]
+    staff = instance["staff"]
+    valid_shift_sequences = instance["valid_shift_sequences"]
+    skill_mix_rules = instance["skill_mix_rules"]
+    unpleasant_shifts = instance["unpleasant_shifts"]
+    if fairness_days is None:
+        fairness_days = num_days
+    elif fairness_days < num_days:
+        raise ValueError(
+            f"fairness_days {fairness_days} is less than the {num_days} "
+            f"days of the previous period"
+        )
+
+    model = cp_model.CpModel()
+    build_report = BuildReport(model)
+    with build_report.stage("create_shift_calendar"):
+        shift_calendar = ShiftCalendar(
+            num_days, shifts, instance["shift_days"]
+        )
+    with build_report.stage("create_compact_instance"):
+        compact_instance = CompactInstance(instance)
+    if history_mode == "variables":
+        with build_report.stage("create_previous_shift_vars"):
+            previous_shift_vars = create_previous_shift_vars(
+                num_days, model, shifts, staff, shift_calendar
+            )
+        previous_unpleasant_shift_counts = None
+        historical_unpleasant_shift_counts = None
+        if fairness_days > num_days:
+            # Days before the previous period contribute constants
+            with build_report.stage(
+                "get_historical_unpleasant_shift_counts"
+            ):
+                historical_unpleasant_shift_counts = (
+                    get_previous_unpleasant_shift_counts(
+                        compact_instance,
+                        unpleasant_shifts,
+                        num_days,
+                        fairness_days,
+                        fairness_decay,
+                        skip_days=num_days,
+                    )
+                )
+    elif history_mode == "constants":
+        # Previous period only contributes constants to the objective
+        previous_shift_vars = {}
+        with build_report.stage("get_previous_unpleasant_shift_counts"):
+            previous_unpleasant_shift_counts = (
+                get_previous_unpleasant_shift_counts(
+                    compact_instance,
+                    unpleasant_shifts,
+                    num_days,
+                    fairness_days,
+                    fairness_decay,
+                )
+            )
+        historical_unpleasant_shift_counts = None
+    else:
+        raise ValueError(f"Unknown history mode: {history_mode}")
+    with build_report.stage("create_shift_vars"):
+        shift_vars = create_shift_vars(
+            previous_shift_vars, model, staff, shifts, shift_calendar
+        )
+    with build_report.stage("create_work_vars"):
+        work_vars = create_work_vars(model, shift_vars)
+        work_var_indexes = get_work_var_indexes(
+            compact_instance, work_vars, num_days
+        )
+    if history_mode == "variables":
+        with build_report.stage("enforce_shifts_already_worked"):
+            enforce_shifts_already_worked(
+                compact_instance,
+                shift_calendar,
+                model,
+                work_vars,
+                num_days,
+            )
+    if sequence_engine == "table":
+        with build_report.stage("get_valid_shift_sequence_permutations"):
+            valid_shift_sequence_permutations = (
+                get_valid_shift_sequence_permutations(
+                    valid_shift_sequences,
+                    DAYS_IN_PARTIAL_SEQUENCE,
+                    num_days,
+                    shift_calendar,
+                    cache_dir=cache_dir,
+                )
+            )
+        with build_report.stage("enforce_shift_sequences") as stage:
+            enforce_shift_sequences(
+                staff,
+                work_vars,
+                shift_calendar,
+                num_days,
+                model,
+                valid_shift_sequence_permutations,
+            )
+            stage["table_tuples"] = len(
+                valid_shift_sequence_permutations
+            ) * len(staff)
+    elif sequence_engine == "automaton":
+        with build_report.stage("get_shift_sequence_automaton") as stage:
+            shift_sequence_automaton = get_shift_sequence_automaton(
+                valid_shift_sequences, DAYS_IN_PARTIAL_SEQUENCE, shifts
+            )
+            stage["automaton_transitions"] = len(shift_sequence_automaton[2])
+        with build_report.stage("enforce_shift_sequences_automaton"):
+            enforce_shift_sequences_automaton(
+                staff,
+                work_vars,
+                shift_calendar,
+                num_days,
+                model,
+                shift_sequence_automaton,
+            )
+    elif sequence_engine == "blocks":
+        with build_report.stage("get_shift_sequence_blocks") as stage:
+            shift_sequence_blocks = get_shift_sequence_blocks(
+                valid_shift_sequences, DAYS_IN_PARTIAL_SEQUENCE
+            )
+            stage["sequence_blocks"] = len(shift_sequence_blocks)
+        with build_report.stage("enforce_shift_sequence_blocks"):
+            enforce_shift_sequence_blocks(
+                staff,
+                work_vars,
+                shift_calendar,
+                num_days,
+                model,
+                shift_sequence_blocks,
+            )
+    else:
+        raise ValueError(f"Unknown sequence engine: {sequence_engine}")
+    with build_report.stage("create_skill_mix_vars"):
+        skill_mix_vars = create_skill_mix_vars(
+            model, shifts, shift_calendar, skill_mix_rules
+        )
+    with build_report.stage("enforce_one_skill_mix_rule_per_shift"):
+        enforce_one_skill_mix_rule_per_shift(
+            shifts, shift_calendar, skill_mix_vars, skill_mix_rules, model
+        )
+    with build_report.stage("enforce_skill_mix_rules"):
+        enforce_skill_mix_rules(
+            shifts,
+            skill_mix_rules,
+            shift_calendar,
+            model,
+            shift_vars,
+            staff,
+            skill_mix_vars,
+        )
+    with build_report.stage("enforce_completion_of_shift_segments"):
+        enforce_completion_of_shift_segments(
+            valid_shift_sequences,
+            DAYS_IN_PARTIAL_SEQUENCE,
+            compact_instance,
+            work_vars,
+            model,
+            shift_calendar,
+        )
+    if symmetry_breaking:
+        with build_report.stage("enforce_symmetry_breaking") as stage:
+            interchangeable_staff = get_interchangeable_staff(
+                compact_instance
+            )
+            enforce_symmetry_breaking(
+                interchangeable_staff,
+                work_vars,
+                shift_calendar,
+                unpleasant_shifts,
+                model,
+                hint_assignment,
+            )
+            stage["interchangeable_groups"] = len(interchangeable_staff)
+    if hint_assignment is not None:
+        with build_report.stage("add_solution_hints"):
+            add_solution_hints(
+                model,
+                shift_vars,
+                skill_mix_vars,
+                staff,
+                hint_assignment,
+                shift_calendar,
+                skill_mix_rules,
+                num_days,
+            )
+    with build_report.stage("configure_objective"):
+        max_unpleasant_shifts = configure_objective(
+            model,
+            work_vars,
+            staff,
+            unpleasant_shifts,
+            num_days,
+            shift_calendar,
+            previous_unpleasant_shift_counts,
+            historical_unpleasant_shift_counts,
+        )
+    return RosterModel(
+        instance,
+        model,
+        shift_calendar,
+        compact_instance,
+        shift_vars,
+        work_vars,
+        work_var_indexes,
+        skill_mix_vars,
+        max_unpleasant_shifts,
+        build_report,
+        get_previous_unpleasant_shift_counts(
+            compact_instance,
+            unpleasant_shifts,
+            num_days,
+            fairness_days,
+            fairness_decay,
+        ),
+    )
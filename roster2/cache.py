@@ -0,0 +1,126 @@
+"""On-disk cache helpers for roster2."""
+import glob
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from ortools.sat.python import cp_model
+
+log = logging.getLogger("roster")
+
+DEFAULT_CACHE_DIR = os.path.join(
+    os.path.expanduser("~"), ".cache", "miniroster"
+)
+
+
+def get_input_hash(*inputs):
+    """Get a canonical hash of JSON serialisable inputs."""
+    encoded = json.dumps(inputs, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+def get_cache_path(cache_dir, kind, key):
+    """Get path of a cache file."""
+    return os.path.join(cache_dir, f"{kind}-{key}.bin")
+
+
+def read_cache_file(path):
+    """Read cache file, returning None if it does not exist."""
+    try:
+        with open(path, "rb") as cache_file:
+            data = cache_file.read()
+    except FileNotFoundError:
+        return None
+    log.debug(f"Cache hit {path}")
+    return data
+
+
+def write_file_atomically(path, data, mode=None):
+    """Write bytes to a file so readers never see it half written.
+
+    The file has permissions mode if given, otherwise those of a
+    temporary file, readable only by its owner.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as temp_file:
+            temp_file.write(data)
+        if mode is not None:
+            os.chmod(temp_path, mode)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def write_cache_file(path, data):
+    """Write cache file atomically."""
+    write_file_atomically(path, data)
+    log.debug(f"Cache write {path}")
+
+
+def evict_cache_files(cache_dir, kind, max_files):
+    """Remove least recently used cache files of a kind beyond max_files.
+
+    Use is tracked by file modification times, so readers should touch
+    files they use.
+    """
+    paths_by_mtime = []
+    for path in glob.glob(get_cache_path(cache_dir, kind, "*")):
+        try:
+            paths_by_mtime.append((os.path.getmtime(path), path))
+        except FileNotFoundError:
+            # Removed by another process
+            continue
+    paths_by_mtime.sort()
+    for _, path in paths_by_mtime[: max(0, len(paths_by_mtime) - max_files)]:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        log.debug(f"Cache evict {path}")
+
+
+def can_serialise_binary(model):
+    """Check whether the model proto can be serialised as binary."""
+    return hasattr(model.Proto(), "SerializeToString")
+
+
+def get_proto_size(model):
+    """Get the model proto size statistic as a dict.
+
+    The binary size is given as proto_bytes where the proto can be
+    serialised as binary, otherwise the size of the text format, which
+    is not comparable, as proto_text_bytes.
+    """
+    if can_serialise_binary(model):
+        return {"proto_bytes": len(serialise_model(model))}
+    return {"proto_text_bytes": len(serialise_model(model))}
+
+
+def serialise_model(model):
+    """Serialise model proto."""
+    proto = model.Proto()
+    if hasattr(proto, "SerializeToString"):
+        return proto.SerializeToString()
+    # Newer OR-Tools model protos only support text format
+    return str(proto).encode()
+
+
+def parse_model(data):
+    """Parse model serialised by serialise_model."""
+    model = cp_model.CpModel()
+    proto = model.Proto()
+    if hasattr(proto, "ParseFromString"):
+        proto.ParseFromString(data)
+        if hasattr(model, "rebuild_var_and_constant_map"):
+            # Variables parsed into the proto are otherwise unknown to
+            # GetBoolVarFromProtoIndex
+            model.rebuild_var_and_constant_map()
+    else:
+        proto.parse_text_format(data.decode())
+        model.rebuild_constant_map()
+    return model
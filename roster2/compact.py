@@ -0,0 +1,59 @@
+"""Integer coded roster2 instances."""
+import numpy as np
+
+# Days off have shift code 0, other shifts are coded by their index in
+# shifts plus one as in the sequence automaton
+DAY_OFF = "X"
+
+
+class CompactInstance:
+    """Roster instance with staff, roles and shifts interned to integers.
+
+    Staff members and roles are numbered in order of appearance. Shift
+    history is an int8 matrix of shift codes with a row per staff member
+    and a column per day, the last column being the day before the
+    roster period.
+    """
+
+    def __init__(self, instance):
+        self.staff = tuple(instance["staff"])
+        self.roles = tuple(
+            dict.fromkeys(
+                role
+                for roles in instance["staff"].values()
+                for role in roles
+            )
+        )
+        self.shifts = tuple(instance["shifts"])
+        self.staff_index = {
+            staff_member: row for row, staff_member in enumerate(self.staff)
+        }
+        self.role_index = {role: num for num, role in enumerate(self.roles)}
+        self.shift_codes = {
+            shift: code + 1 for code, shift in enumerate(self.shifts)
+        }
+        self.shift_codes[DAY_OFF] = 0
+        self.staff_roles = tuple(
+            tuple(
+                self.role_index[role]
+                for role in instance["staff"][staff_member]
+            )
+            for staff_member in self.staff
+        )
+        self.history = self.encode_assignment(instance["previous_shifts"])
+
+    def encode_shifts(self, shifts):
+        """Get shift codes of a list of shifts."""
+        return np.array(
+            [self.shift_codes[shift] for shift in shifts], dtype=np.int8
+        )
+
+    def encode_assignment(self, assignment):
+        """Get staff by day matrix of shift codes of an assignment."""
+        return np.array(
+            [
+                self.encode_shifts(assignment[staff_member])
+                for staff_member in self.staff
+            ],
+            dtype=np.int8,
+        ).reshape(len(self.staff), -1)
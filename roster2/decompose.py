@@ -0,0 +1,198 @@
+"""Decomposition of roster instances into independent sub-rosters.
+
+Staff and roles that share no constraints are rostered separately. Two
+roles are linked when a staff member has both, or when they appear in
+the alternative skill mix rules of the same shift, since the choice of
+rule couples their counts. Each connected group of roles and their staff
+is built and solved as its own model in a worker process and the
+assignments are merged.
+"""
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from cache import DEFAULT_CACHE_DIR
+from logic import get_process_solver_profile, solve
+from model_cache import build_model_cached
+from result import RosterResult
+
+log = logging.getLogger("roster")
+
+
+def get_role_components(staff, skill_mix_rules):
+    """Get groups of roles linked by staff or alternative skill mix rules.
+
+    Returns a list of sets of roles, in order of first appearance.
+    """
+    parent = {}
+
+    def find(role):
+        parent.setdefault(role, role)
+        while parent[role] != role:
+            parent[role] = parent[parent[role]]
+            role = parent[role]
+        return role
+
+    def union(roles):
+        roles = list(roles)
+        for role in roles:
+            find(role)
+        for role in roles[1:]:
+            parent[find(role)] = find(roles[0])
+
+    for roles in staff.values():
+        union(roles)
+    for rules in skill_mix_rules.values():
+        if len(rules) > 1:
+            union(role for rule in rules for role in rule)
+        else:
+            # A single rule constrains each role count independently
+            for rule in rules:
+                for role in rule:
+                    find(role)
+
+    components = {}
+    for role in parent:
+        components.setdefault(find(role), set()).add(role)
+    return list(components.values())
+
+
+def get_sub_instance(instance, roles):
+    """Get the part of an instance covering a group of roles.
+
+    All shifts are kept so sequences are unchanged. Skill mix rules are
+    reduced to the counts for roles in the group, leaving a single empty
+    rule for shifts the group is not counted on.
+    """
+    staff = {
+        staff_member: staff_roles
+        for staff_member, staff_roles in instance["staff"].items()
+        if roles.intersection(staff_roles)
+    }
+    skill_mix_rules = {}
+    for shift, rules in instance["skill_mix_rules"].items():
+        sub_rules = []
+        for rule in rules:
+            sub_rule = {
+                role: count for role, count in rule.items() if role in roles
+            }
+            if sub_rule not in sub_rules:
+                sub_rules.append(sub_rule)
+        skill_mix_rules[shift] = tuple(sub_rules)
+    return {
+        **instance,
+        "staff": staff,
+        "previous_shifts": {
+            staff_member: instance["previous_shifts"][staff_member]
+            for staff_member in staff
+        },
+        "skill_mix_rules": skill_mix_rules,
+    }
+
+
+def decompose_instance(instance):
+    """Split an instance into independent sub-instances.
+
+    Groups of roles without staff have no variables and are dropped.
+    """
+    sub_instances = []
+    for roles in get_role_components(
+        instance["staff"], instance["skill_mix_rules"]
+    ):
+        sub_instance = get_sub_instance(instance, roles)
+        if sub_instance["staff"]:
+            sub_instances.append(sub_instance)
+    return sub_instances
+
+
+def solve_sub_instance(
+    sub_instance,
+    sequence_engine,
+    cache_dir,
+    history_mode,
+    solver_profile,
+    symmetry_breaking,
+    fairness_days,
+    fairness_decay,
+):
+    """Build and solve a sub-instance in a worker process.
+
+    Returns the assignment, maximum unpleasant shifts and build report.
+    """
+    roster_model = build_model_cached(
+        sub_instance,
+        sequence_engine=sequence_engine,
+        cache_dir=cache_dir,
+        history_mode=history_mode,
+        symmetry_breaking=symmetry_breaking,
+        fairness_days=fairness_days,
+        fairness_decay=fairness_decay,
+    )
+    solver = solve(roster_model.model, solver_profile)
+    result = RosterResult.from_solver(roster_model, solver)
+    return (
+        result.get_assignment(),
+        result.max_unpleasant_shifts,
+        roster_model.build_report.to_dict(),
+    )
+
+
+def solve_decomposed(
+    instance,
+    sequence_engine="table",
+    cache_dir=DEFAULT_CACHE_DIR,
+    history_mode="variables",
+    solver_profile=None,
+    max_processes=None,
+    symmetry_breaking=True,
+    fairness_days=None,
+    fairness_decay=1.0,
+):
+    """Solve each independent sub-roster of an instance in parallel.
+
+    Returns the merged assignment in the staff order of the instance,
+    the maximum unpleasant shifts over all sub-rosters and the build
+    report of each sub-roster. Raises SolutionNotFeasible if any
+    sub-roster is infeasible.
+    """
+    sub_instances = decompose_instance(instance)
+    num_processes = min(
+        len(sub_instances), max_processes or os.cpu_count() or 1
+    )
+    log.info(
+        f"Solving {len(sub_instances)} independent sub-rosters "
+        f"in {num_processes} processes"
+    )
+    solver_profile = get_process_solver_profile(
+        solver_profile, num_processes
+    )
+    with ProcessPoolExecutor(max_workers=num_processes) as executor:
+        results = list(
+            executor.map(
+                solve_sub_instance,
+                sub_instances,
+                [sequence_engine] * len(sub_instances),
+                [cache_dir] * len(sub_instances),
+                [history_mode] * len(sub_instances),
+                [solver_profile] * len(sub_instances),
+                [symmetry_breaking] * len(sub_instances),
+                [fairness_days] * len(sub_instances),
+                [fairness_decay] * len(sub_instances),
+            )
+        )
+    assignment = {}
+    for sub_assignment, _, _ in results:
+        assignment.update(sub_assignment)
+    assignment = {
+        staff_member: assignment[staff_member]
+        for staff_member in instance["staff"]
+    }
+    max_unpleasant_shifts = max(
+        sub_max_unpleasant_shifts
+        for _, sub_max_unpleasant_shifts, _ in results
+    )
+    return (
+        assignment,
+        max_unpleasant_shifts,
+        [build_report for _, _, build_report in results],
+    )
@@ -0,0 +1,418 @@
+"""Feasibility screening and infeasibility diagnosis for roster2.
+
+Screening checks an instance in pure Python before a model is built, so
+staffing shortfalls and history that cannot continue are rejected in
+milliseconds rather than left to the solver to prove infeasible.
+
+Diagnosis makes the constraints of each build stage conditional on an
+assumption literal and reports a minimal set of stages that conflict.
+"""
+import logging
+
+from ortools.sat.python import cp_model
+
+from builder import DAYS_IN_PARTIAL_SEQUENCE
+from compact import DAY_OFF
+from logic import (
+    SolutionNotFeasible,
+    create_solver,
+    get_shift_sequence_automaton,
+)
+from shift_calendar import ShiftCalendar
+
+log = logging.getLogger("roster")
+
+# Constraint types every supported OR-Tools version can enforce with a
+# literal
+ENFORCEABLE_CONSTRAINT_TYPES = ("bool_or", "bool_and", "linear", "table")
+
+# Constraint types rewritten as linear constraints to be enforced, with
+# the domain of the sum of their literals
+LINEARISABLE_CONSTRAINT_TYPES = {"exactly_one": (1, 1), "at_most_one": (0, 1)}
+
+
+class InstanceNotFeasible(SolutionNotFeasible):
+    """Exception for instances rejected by feasibility screening."""
+
+    def __init__(self, problems):
+        super().__init__("Instance not feasible: " + "; ".join(problems))
+        self.problems = problems
+
+
+def get_role_sizes(staff):
+    """Count staff members with each role."""
+    role_sizes = {}
+    for roles in staff.values():
+        for role in roles:
+            role_sizes[role] = role_sizes.get(role, 0) + 1
+    return role_sizes
+
+
+def get_usable_skill_mix_rules(skill_mix_rules, role_sizes):
+    """Get skill mix rules of each shift that there are enough staff for."""
+    return {
+        shift: [
+            rule
+            for rule in rules
+            if all(
+                count <= role_sizes.get(role, 0)
+                for role, count in rule.items()
+            )
+        ]
+        for shift, rules in skill_mix_rules.items()
+    }
+
+
+def get_possible_shifts_by_day(
+    valid_shift_sequences, shifts, num_days, shift_calendar
+):
+    """Get shifts that valid shift sequences can place on each day.
+
+    Sequences are followed from the start of the roster period as in
+    the sequence automaton. A shift placed on a day it does not run
+    counts as a day off, as in the permutation table.
+    """
+    starting_state, _, transition_triples = get_shift_sequence_automaton(
+        valid_shift_sequences, DAYS_IN_PARTIAL_SEQUENCE, shifts
+    )
+    transitions = {}
+    for state, shift_code, next_state in transition_triples:
+        transitions.setdefault(state, []).append((shift_code, next_state))
+    states = {starting_state}
+    possible_shifts_by_day = {}
+    for day in range(1, num_days + 1):
+        possible_shifts = set()
+        next_states = set()
+        for state in states:
+            for shift_code, next_state in transitions.get(state, ()):
+                next_states.add(next_state)
+                if shift_code and shift_calendar.runs_on(
+                    shifts[shift_code - 1], day
+                ):
+                    possible_shifts.add(shifts[shift_code - 1])
+        possible_shifts_by_day[day] = possible_shifts
+        states = next_states
+    return possible_shifts_by_day
+
+
+def screen_instance_data(instance):
+    """Check instance data refers to known staff, shifts and roles."""
+    problems = []
+    shifts = set(instance["shifts"])
+    for key in ("shift_days", "skill_mix_rules"):
+        missing_shifts = shifts - set(instance[key])
+        if missing_shifts:
+            problems.append(f"No {key} for shifts {sorted(missing_shifts)}")
+    for seq_num, valid_shift_sequence in enumerate(
+        instance["valid_shift_sequences"]
+    ):
+        unknown_shifts = set(valid_shift_sequence) - shifts - {DAY_OFF}
+        if unknown_shifts:
+            problems.append(
+                f"Valid shift sequence {seq_num} has unknown shifts "
+                f"{sorted(unknown_shifts)}"
+            )
+    for shift, days in instance["shift_days"].items():
+        if any(day < 1 or day > instance["num_days"] for day in days):
+            problems.append(f"Shift {shift} runs outside the roster period")
+    for staff_member in instance["staff"]:
+        shifts_worked = instance["previous_shifts"].get(staff_member)
+        if shifts_worked is None:
+            problems.append(f"No previous shifts for {staff_member}")
+        elif len(shifts_worked) < instance["num_days"]:
+            problems.append(
+                f"{staff_member} has {len(shifts_worked)} previous shifts "
+                f"but there are {instance['num_days']} days"
+            )
+        elif set(shifts_worked) - shifts - {DAY_OFF}:
+            problems.append(
+                f"{staff_member} has unknown previous shifts "
+                f"{sorted(set(shifts_worked) - shifts - {DAY_OFF})}"
+            )
+    return problems
+
+
+def screen_staffing(instance, shift_calendar, usable_skill_mix_rules):
+    """Check there are enough staff to cover each day.
+
+    Each shift needs at least the staff of its smallest usable skill mix
+    rule, and staff work at most one shift a day.
+    """
+    problems = []
+    role_sizes = get_role_sizes(instance["staff"])
+    possible_shifts_by_day = get_possible_shifts_by_day(
+        instance["valid_shift_sequences"],
+        instance["shifts"],
+        instance["num_days"],
+        shift_calendar,
+    )
+    for shift in instance["shifts"]:
+        if not usable_skill_mix_rules[shift]:
+            problems.append(
+                f"No skill mix rule for shift {shift} can be met by "
+                f"staff with roles {role_sizes}"
+            )
+    short_days = {}
+    unplaced_days = {}
+    for day in range(1, instance["num_days"] + 1):
+        role_needs = {}
+        total_need = 0
+        for shift in shift_calendar.shifts_on_day(day):
+            rules = usable_skill_mix_rules[shift]
+            if not rules:
+                continue
+            for role in set().union(*rules):
+                role_needs[role] = role_needs.get(role, 0) + min(
+                    rule.get(role, 0) for rule in rules
+                )
+            min_staff = min(sum(rule.values()) for rule in rules)
+            total_need += min_staff
+            if min_staff and shift not in possible_shifts_by_day[day]:
+                unplaced_days.setdefault(shift, []).append(day)
+        for role, need in role_needs.items():
+            if need > role_sizes.get(role, 0):
+                short_days.setdefault(role, []).append(day)
+        if total_need > len(instance["staff"]):
+            short_days.setdefault(None, []).append(day)
+    for role, days in short_days.items():
+        problems.append(
+            f"Not enough {'staff' if role is None else role + ' staff'} "
+            f"for the shifts on days {days}"
+        )
+    for shift, days in unplaced_days.items():
+        problems.append(
+            f"Shift {shift} needs staff on days {days} but no valid shift "
+            f"sequence has it on those days"
+        )
+    return problems
+
+
+def screen_history(instance, shift_calendar, usable_skill_mix_rules):
+    """Check shift history ends in a way the roster period can continue.
+
+    When the last days of a staff member's history begin a longer valid
+    shift sequence its end is worked at the start of the roster period,
+    so that end must fit the shift calendar and, with other staff, the
+    skill mix rules. Other history, such as a period with sick days, is
+    not constrained by the model.
+    """
+    problems = []
+    days = DAYS_IN_PARTIAL_SEQUENCE
+    end_segments_by_begin_segment = {}
+    for valid_shift_sequence in instance["valid_shift_sequences"]:
+        if len(valid_shift_sequence) > days:
+            end_segments_by_begin_segment.setdefault(
+                tuple(valid_shift_sequence[:days]), set()
+            ).add(tuple(valid_shift_sequence[-days:]))
+    forced_staff = {}
+    for staff_member in instance["staff"]:
+        tail = tuple(instance["previous_shifts"][staff_member][-days:])
+        end_segments = end_segments_by_begin_segment.get(tail, set())
+        if len(end_segments) > 1:
+            problems.append(
+                f"History of {staff_member} must continue with "
+                f"{len(end_segments)} different sequence ends"
+            )
+        for end_segment in end_segments:
+            for day, shift in enumerate(end_segment, start=1):
+                if shift == DAY_OFF:
+                    continue
+                if not shift_calendar.runs_on(shift, day):
+                    problems.append(
+                        f"History of {staff_member} continues with shift "
+                        f"{shift} on day {day} when it does not run"
+                    )
+                else:
+                    forced_staff[(day, shift)] = (
+                        forced_staff.get((day, shift), 0) + 1
+                    )
+    for (day, shift), num_staff in sorted(forced_staff.items()):
+        rules = usable_skill_mix_rules[shift]
+        if rules and num_staff > max(sum(rule.values()) for rule in rules):
+            problems.append(
+                f"History has {num_staff} staff continuing on shift "
+                f"{shift} on day {day}, more than any skill mix rule"
+            )
+    return problems
+
+
+def screen_instance(instance):
+    """Get problems that make an instance infeasible.
+
+    Returns a list of descriptions, empty if none were found. Screening
+    is a quick necessary check, so an instance passing it may still be
+    infeasible.
+    """
+    problems = screen_instance_data(instance)
+    if problems:
+        # Later checks rely on the instance data being consistent
+        return problems
+    shift_calendar = ShiftCalendar(
+        instance["num_days"], instance["shifts"], instance["shift_days"]
+    )
+    usable_skill_mix_rules = get_usable_skill_mix_rules(
+        instance["skill_mix_rules"], get_role_sizes(instance["staff"])
+    )
+    return screen_staffing(
+        instance, shift_calendar, usable_skill_mix_rules
+    ) + screen_history(instance, shift_calendar, usable_skill_mix_rules)
+
+
+def check_instance(instance):
+    """Raise InstanceNotFeasible if screening finds problems."""
+    problems = screen_instance(instance)
+    if problems:
+        for problem in problems:
+            log.info(f"Screening: {problem}")
+        raise InstanceNotFeasible(problems)
+
+
+def get_constraint_groups(roster_model):
+    """Get the proto indexes of constraints added by each build stage.
+
+    Constraints added after the model was built, such as locked shifts
+    when re-rostering, form a final "after_build" group.
+    """
+    constraint_groups = {}
+    start = 0
+    for stage in roster_model.build_report.stages:
+        end = start + stage["constraints_added"]
+        if end > start:
+            constraint_groups[stage["stage"]] = range(start, end)
+        start = end
+    num_constraints = len(roster_model.model.Proto().constraints)
+    if num_constraints > start:
+        constraint_groups["after_build"] = range(start, num_constraints)
+    return constraint_groups
+
+
+def get_constraint_type(constraint):
+    """Get the type of a constraint proto, such as "linear"."""
+    if hasattr(constraint, "WhichOneof"):
+        return constraint.WhichOneof("constraint")
+    # Newer OR-Tools model protos have a has_ method per type
+    for name in dir(constraint):
+        if name.startswith("has_") and getattr(constraint, name)():
+            return name[len("has_") :]
+    return None
+
+
+def clear_constraint(constraint):
+    """Clear a constraint proto so it no longer constrains anything."""
+    if hasattr(constraint, "Clear"):
+        constraint.Clear()
+    else:
+        constraint.enforcement_literal.clear()
+        getattr(constraint, f"clear_{get_constraint_type(constraint)}")()
+
+
+def get_literal(model, ref):
+    """Get the literal of a proto reference, negative if negated."""
+    if ref >= 0:
+        return model.GetBoolVarFromProtoIndex(ref)
+    return model.GetBoolVarFromProtoIndex(-ref - 1).Not()
+
+
+def enforce_constraint_group(model, indexes, group_literal):
+    """Make constraints of a group conditional on the group literal.
+
+    Constraint types that cannot be enforced by a literal are rewritten
+    as linear constraints where possible. Returns False, changing
+    nothing, if the group has a constraint that can be neither.
+    """
+    proto = model.Proto()
+    constraint_types = [
+        get_constraint_type(proto.constraints[index]) for index in indexes
+    ]
+    if not all(
+        constraint_type in ENFORCEABLE_CONSTRAINT_TYPES
+        or constraint_type in LINEARISABLE_CONSTRAINT_TYPES
+        for constraint_type in constraint_types
+    ):
+        return False
+    for index, constraint_type in zip(indexes, constraint_types):
+        constraint = proto.constraints[index]
+        if constraint_type in ENFORCEABLE_CONSTRAINT_TYPES:
+            constraint.enforcement_literal.append(group_literal.Index())
+            continue
+        literals = [
+            get_literal(model, ref)
+            for ref in getattr(constraint, constraint_type).literals
+        ]
+        enforcement_literals = [
+            get_literal(model, ref) for ref in constraint.enforcement_literal
+        ]
+        lower_bound, upper_bound = LINEARISABLE_CONSTRAINT_TYPES[
+            constraint_type
+        ]
+        model.AddLinearConstraint(
+            sum(literals), lower_bound, upper_bound
+        ).OnlyEnforceIf(enforcement_literals + [group_literal])
+        clear_constraint(constraint)
+    return True
+
+
+def diagnose_infeasibility(roster_model, solver_profile=None):
+    """Find a minimal set of build stages whose constraints conflict.
+
+    A copy of the model without objective or hints has the constraints
+    of each build stage enforced by an assumption literal. The solver
+    reports a set of assumptions that is infeasible, which is then
+    reduced by dropping each stage while the rest still conflict. Stages
+    with constraints such as automatons that cannot be made conditional
+    are always enforced and are not reported. The model must have been
+    built rather than loaded from the cache, so its build report has a
+    stage per constraint group. Returns the stage names, or an empty
+    list if the model is not proven infeasible. Raises ValueError if
+    the conditional model is invalid.
+    """
+    model = roster_model.model.Clone()
+    model.ClearObjective()
+    model.ClearHints()
+    group_literals = {}
+    always_enforced_groups = []
+    for name, indexes in get_constraint_groups(roster_model).items():
+        group_literal = model.NewBoolVar(f"group:{name}")
+        if enforce_constraint_group(model, indexes, group_literal):
+            group_literals[name] = group_literal
+        else:
+            always_enforced_groups.append(name)
+    if always_enforced_groups:
+        log.info(
+            f"Constraint groups {always_enforced_groups} cannot be made "
+            f"conditional, so are always enforced in the diagnosis"
+        )
+    validation_error = model.Validate()
+    if validation_error:
+        raise ValueError(f"Invalid diagnosis model: {validation_error}")
+
+    def get_conflicting_groups(names):
+        model.ClearAssumptions()
+        model.AddAssumptions([group_literals[name] for name in names])
+        solver = create_solver(solver_profile)
+        solution_status = solver.Solve(model)
+        if solution_status == cp_model.MODEL_INVALID:
+            raise ValueError("Invalid diagnosis model")
+        if solution_status != cp_model.INFEASIBLE:
+            return None
+        names_by_index = {
+            group_literals[name].Index(): name for name in names
+        }
+        return [
+            names_by_index[index]
+            for index in solver.SufficientAssumptionsForInfeasibility()
+        ]
+
+    conflicting_groups = get_conflicting_groups(list(group_literals))
+    if conflicting_groups is None:
+        return []
+    for name in list(conflicting_groups):
+        if name not in conflicting_groups:
+            continue
+        smaller_groups = get_conflicting_groups(
+            [other for other in conflicting_groups if other != name]
+        )
+        if smaller_groups is not None:
+            conflicting_groups = smaller_groups
+    log.info(f"Conflicting constraint groups: {conflicting_groups}")
+    return conflicting_groups
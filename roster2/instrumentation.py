@@ -0,0 +1,80 @@
+"""Per-stage instrumentation of roster2 model builds."""
+import json
+import logging
+import time
+from contextlib import contextmanager
+
+from cache import get_proto_size
+
+log = logging.getLogger("roster")
+
+
+class BuildReport:
+    """Wall time and model growth of each stage of a model build."""
+
+    def __init__(self, model):
+        self.model = model
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name):
+        """Record statistics for the build stage run inside the context.
+
+        The yielded dict can be given extra statistics such as
+        table_tuples.
+        """
+        proto = self.model.Proto()
+        num_variables = len(proto.variables)
+        num_constraints = len(proto.constraints)
+        stage = {"stage": name}
+        start_time = time.perf_counter()
+        yield stage
+        stage["wall_time"] = time.perf_counter() - start_time
+        stage["variables_added"] = len(proto.variables) - num_variables
+        stage["constraints_added"] = len(proto.constraints) - num_constraints
+        self.stages.append(stage)
+
+    def to_dict(self):
+        """Get report as a JSON serialisable dict."""
+        proto = self.model.Proto()
+        return {
+            "stages": self.stages,
+            "wall_time": sum(stage["wall_time"] for stage in self.stages),
+            "num_variables": len(proto.variables),
+            "num_constraints": len(proto.constraints),
+            "table_tuples": sum(
+                stage.get("table_tuples", 0) for stage in self.stages
+            ),
+            **get_proto_size(self.model),
+        }
+
+    def log_report(self, report=None):
+        """Log report, one line per stage."""
+        report = report or self.to_dict()
+        for stage in report["stages"]:
+            log.info(
+                f"Stage {stage['stage']}: {stage['wall_time']:.3f}s, "
+                f"{stage['variables_added']} variables, "
+                f"{stage['constraints_added']} constraints"
+                + (
+                    f", {stage['table_tuples']} table tuples"
+                    if "table_tuples" in stage
+                    else ""
+                )
+            )
+        log.info(
+            f"Model build {report['wall_time']:.3f}s, "
+            f"{report['num_variables']} variables, "
+            f"{report['num_constraints']} constraints, "
+            f"{report['table_tuples']} table tuples, "
+            + (
+                f"{report['proto_bytes']} proto bytes"
+                if "proto_bytes" in report
+                else f"{report['proto_text_bytes']} proto text bytes"
+            )
+        )
+
+    def write(self, path, report=None):
+        """Write report as JSON."""
+        with open(path, "w") as report_file:
+            json.dump(report or self.to_dict(), report_file, indent=2)
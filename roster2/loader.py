@@ -0,0 +1,122 @@
+"""Load roster2 instances from files.
+
+An instance directory holds:
+
+- instance.json with num_days, shifts, shift_days, skill_mix_rules,
+  valid_shift_sequences, unpleasant_shifts and staff.
+- staff.csv, optional, with staff and roles columns, roles separated by
+  semicolons. It takes the place of staff in instance.json.
+- history.npy, an int8 matrix of shift codes with a row per day, oldest
+  first, and a column per staff member. Days off are 0 and other shifts
+  are coded by their index in shifts plus one.
+
+History is memory mapped and stored day by day, so reading the window
+before the roster period only touches the end of the file however many
+years of history it holds.
+"""
+import argparse
+import csv
+import json
+import os
+
+import numpy as np
+
+from builder import INSTANCE_KEYS, get_default_instance
+from compact import DAY_OFF, CompactInstance
+
+INSTANCE_FILE = "instance.json"
+STAFF_FILE = "staff.csv"
+HISTORY_FILE = "history.npy"
+
+
+def read_staff_csv(path):
+    """Read staff members and their roles from CSV."""
+    with open(path, newline="") as staff_file:
+        return {
+            row["staff"]: row["roles"].split(";")
+            for row in csv.DictReader(staff_file)
+        }
+
+
+def load_history(path, staff, shifts, num_history_days):
+    """Load shifts of the last num_history_days days of history.
+
+    Only that window of the memory mapped history matrix is read.
+    """
+    history = np.load(path, mmap_mode="r")
+    if history.shape[1] != len(staff):
+        raise ValueError(
+            f"History has {history.shape[1]} staff columns "
+            f"but there are {len(staff)} staff members."
+        )
+    if history.shape[0] < num_history_days:
+        raise ValueError(
+            f"History has {history.shape[0]} days "
+            f"but {num_history_days} are needed."
+        )
+    shift_names = np.array([DAY_OFF] + list(shifts), dtype=object)
+    window = np.asarray(history[history.shape[0] - num_history_days :])
+    return {
+        staff_member: shift_names[shift_codes].tolist()
+        for staff_member, shift_codes in zip(staff, window.T)
+    }
+
+
+def load_instance(directory, num_history_days=None):
+    """Load instance from a directory.
+
+    previous_shifts holds the last num_history_days days of history,
+    and at least num_days for the sequences running into the period.
+    """
+    with open(os.path.join(directory, INSTANCE_FILE)) as instance_file:
+        instance = json.load(instance_file)
+    staff_path = os.path.join(directory, STAFF_FILE)
+    if os.path.exists(staff_path):
+        instance["staff"] = read_staff_csv(staff_path)
+    instance["previous_shifts"] = load_history(
+        os.path.join(directory, HISTORY_FILE),
+        list(instance["staff"]),
+        instance["shifts"],
+        max(num_history_days or 0, instance["num_days"]),
+    )
+    # Skill mix rules are tuples in data.py
+    instance["skill_mix_rules"] = {
+        shift: tuple(rules)
+        for shift, rules in instance["skill_mix_rules"].items()
+    }
+    return {key: instance[key] for key in INSTANCE_KEYS}
+
+
+def save_instance(instance, directory, history=None):
+    """Save instance to a directory.
+
+    history maps staff members to shifts worked, oldest first, and
+    defaults to the instance's previous_shifts.
+    """
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, INSTANCE_FILE), "w") as instance_file:
+        json.dump(
+            {
+                key: instance[key]
+                for key in INSTANCE_KEYS
+                if key != "previous_shifts"
+            },
+            instance_file,
+            indent=2,
+        )
+    compact_instance = CompactInstance(
+        {**instance, "previous_shifts": history or instance["previous_shifts"]}
+    )
+    np.save(
+        os.path.join(directory, HISTORY_FILE),
+        np.ascontiguousarray(compact_instance.history.T),
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "directory", help="directory to save the data.py instance to"
+    )
+    args = parser.parse_args()
+    save_instance(get_default_instance(), args.directory)
@@ -1,8 +1,20 @@
 """Mini roster 2."""
+import json
 import logging
-from itertools import product
+import os
+import struct
+from itertools import chain, islice, product
+
+import numpy as np
 from ortools.sat.python import cp_model
 
+from cache import (
+    get_cache_path,
+    get_input_hash,
+    read_cache_file,
+    write_cache_file,
+)
+
 log = logging.getLogger("roster")
 
 
@@ -12,7 +24,7 @@ class SolutionNotFeasible(Exception):
     pass
 
 
-def create_previous_shift_vars(num_days, model, shifts, staff, shift_days):
+def create_previous_shift_vars(num_days, model, shifts, staff, shift_calendar):
     """Shift variables for previous roster period."""
     prev_shift_vars = {
         (staff_member, role, day - num_days, shift): model.NewBoolVar(
@@ -24,12 +36,12 @@ def create_previous_shift_vars(num_days, model, shifts, staff, shift_days):
         for staff_member in staff
         for role in staff[staff_member]
         for shift in shifts
-        for day in shift_days[shift]
+        for day in shift_calendar.days(shift)
     }
     return prev_shift_vars
 
 
-def create_shift_vars(prev_shift_vars, model, staff, shifts, shift_days):
+def create_shift_vars(prev_shift_vars, model, staff, shifts, shift_calendar):
     """Shift variables for current roster period."""
     shift_vars = {
         (staff_member, role, day, shift): model.NewBoolVar(
@@ -38,43 +50,56 @@ def create_shift_vars(prev_shift_vars, model, staff, shifts, shift_days):
         for staff_member in staff
         for role in staff[staff_member]
         for shift in shifts
-        for day in shift_days[shift]
+        for day in shift_calendar.days(shift)
     }
     # Combine previous and current shift variables
     shift_vars = {**prev_shift_vars, **shift_vars}
     return shift_vars
 
 
+def create_work_vars(model, shift_vars):
+    """Variables for staff members working a shift in any of their roles.
+
+    Staff members with one role reuse their shift variables. For staff
+    members with several roles a new variable is channelled to the sum
+    of their role shift variables, so they work at most one role per
+    shift and sequences and fairness only need one variable per person.
+    """
+    role_shift_vars = {}
+    for (staff_member, role, day, shift), shift_var in shift_vars.items():
+        role_shift_vars.setdefault((staff_member, day, shift), []).append(
+            shift_var
+        )
+    work_vars = {}
+    for (staff_member, day, shift), shift_vars_for_roles in (
+        role_shift_vars.items()
+    ):
+        if len(shift_vars_for_roles) == 1:
+            work_vars[(staff_member, day, shift)] = shift_vars_for_roles[0]
+        else:
+            work_var = model.NewBoolVar(
+                f"staff:{staff_member}_day:{day}_shift:{shift}"
+            )
+            model.Add(work_var == sum(shift_vars_for_roles))
+            work_vars[(staff_member, day, shift)] = work_var
+    return work_vars
+
+
 def enforce_shifts_already_worked(
-    staff, previous_shifts, shifts, shift_days, model, shift_vars, num_days
+    compact_instance, shift_calendar, model, work_vars, num_days
 ):
     """Enforce shifts already worked."""
-    for staff_member in staff:
-        for day, shift in enumerate(previous_shifts[staff_member]):
-            if shift == "X":
-                for shift in shifts:
-                    if day + 1 in shift_days[shift]:
-                        model.Add(
-                            shift_vars[
-                                (
-                                    staff_member,
-                                    staff[staff_member][0],
-                                    day + 1 - num_days,
-                                    shift,
-                                )
-                            ]
-                            == 0
-                        )
+    shifts = compact_instance.shifts
+    for staff_member, shift_codes in zip(
+        compact_instance.staff, compact_instance.history[:, -num_days:]
+    ):
+        for day, shift_code in zip(range(1 - num_days, 1), shift_codes):
+            if shift_code == 0:
+                for shift in shift_calendar.shifts_on_day(day):
+                    model.Add(work_vars[(staff_member, day, shift)] == 0)
             else:
                 model.Add(
-                    shift_vars[
-                        (
-                            staff_member,
-                            staff[staff_member][0],
-                            day + 1 - num_days,
-                            shift,
-                        )
-                    ]
+                    work_vars[(staff_member, day, shifts[shift_code - 1])]
                     == 1
                 )
 
@@ -82,12 +107,10 @@ def enforce_shifts_already_worked(
 def enforce_completion_of_shift_segments(
     valid_shift_sequences,
     days_in_partial_sequence,
-    previous_shifts,
-    shift_vars,
+    compact_instance,
+    work_vars,
     model,
-    staff,
-    shift_days,
-    shifts,
+    shift_calendar,
 ):
     """Enforce completion of shift segments."""
     shift_sequence_begin_segments = []
@@ -96,59 +119,109 @@ def enforce_completion_of_shift_segments(
     for valid_shift_sequence in valid_shift_sequences:
         if len(valid_shift_sequence) > days_in_partial_sequence:
             shift_sequence_begin_segments.append(
-                valid_shift_sequence[0:days_in_partial_sequence:]
+                compact_instance.encode_shifts(
+                    valid_shift_sequence[0:days_in_partial_sequence:]
+                )
             )
             shift_sequence_end_segments.append(
                 valid_shift_sequence[-days_in_partial_sequence:]
             )
-    for staff_member in previous_shifts:
-        for seg_num, shift_sequence_begin_segment in enumerate(
-            shift_sequence_begin_segments
-        ):
-            if (
-                shift_sequence_begin_segment
-                == previous_shifts[staff_member][-days_in_partial_sequence:]
-            ):
-                shift_sequence_end_segment = shift_sequence_end_segments[
-                    seg_num
-                ]
-                for day_num, shift in enumerate(shift_sequence_end_segment):
-                    if shift == "X":
-                        for shift in shifts:
-                            if day_num + 1 in shift_days[shift]:
-                                model.Add(
-                                    shift_vars[
-                                        (
-                                            staff_member,
-                                            staff[staff_member][0],
-                                            day_num + 1,
-                                            shift,
-                                        )
-                                    ]
-                                    == 0
-                                )
-                    else:
-                        model.Add(
-                            shift_vars[
-                                (
-                                    staff_member,
-                                    staff[staff_member][0],
-                                    day_num + 1,
-                                    shift,
-                                )
-                            ]
-                            == 1
-                        )
+    if not shift_sequence_begin_segments:
+        return
+    # Compare end of history of all staff with all begin segments at once
+    segment_matches = (
+        compact_instance.history[:, None, -days_in_partial_sequence:]
+        == np.array(shift_sequence_begin_segments)[None, :, :]
+    ).all(axis=2)
+    for row, seg_num in np.argwhere(segment_matches):
+        staff_member = compact_instance.staff[row]
+        shift_sequence_end_segment = shift_sequence_end_segments[seg_num]
+        for day_num, shift in enumerate(shift_sequence_end_segment):
+            if shift == "X":
+                for shift in shift_calendar.shifts_on_day(day_num + 1):
+                    model.Add(
+                        work_vars[(staff_member, day_num + 1, shift)] == 0
+                    )
+            else:
+                model.Add(work_vars[(staff_member, day_num + 1, shift)] == 1)
 
 
-def get_valid_shift_sequence_permutations(
-    valid_shift_sequences,
-    days_in_partial_sequence,
-    num_days,
-    shift_days,
-    shifts,
+def get_work_var_indexes(compact_instance, work_vars, num_days):
+    """Get proto indexes of work variables in the current period.
+
+    Returns an int32 array indexed by staff row, day - 1 and shift code
+    - 1, with -1 where a shift does not run.
+    """
+    work_var_indexes = np.full(
+        (len(compact_instance.staff), num_days, len(compact_instance.shifts)),
+        -1,
+        dtype=np.int32,
+    )
+    staff_index = compact_instance.staff_index
+    shift_codes = compact_instance.shift_codes
+    for (staff_member, day, shift), work_var in work_vars.items():
+        if day >= 1:
+            work_var_indexes[
+                staff_index[staff_member], day - 1, shift_codes[shift] - 1
+            ] = work_var.Index()
+    return work_var_indexes
+
+
+class PackedShiftTable:
+    """Bit-packed table of allowed shift assignments.
+
+    Each row is stored as row_width bits in a shared bytearray and is
+    unpacked to a tuple of 0/1 values on iteration.
+    """
+
+    header = struct.Struct("<4sII")
+    magic = b"MRPT"
+
+    def __init__(self, row_width, rows=b""):
+        self.row_width = row_width
+        self.row_size = (row_width + 7) // 8
+        self.rows = bytearray(rows)
+
+    def __len__(self):
+        return len(self.rows) // self.row_size
+
+    def __iter__(self):
+        for offset in range(0, len(self.rows), self.row_size):
+            row = int.from_bytes(
+                self.rows[offset : offset + self.row_size], "little"
+            )
+            yield tuple((row >> bit) & 1 for bit in range(self.row_width))
+
+    def append(self, row):
+        """Append row given as an integer bit mask."""
+        self.rows += row.to_bytes(self.row_size, "little")
+
+    def to_bytes(self):
+        """Serialise table."""
+        return (
+            self.header.pack(self.magic, self.row_width, len(self))
+            + self.rows
+        )
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Deserialise table."""
+        magic, row_width, num_rows = cls.header.unpack_from(data)
+        if magic != cls.magic:
+            raise ValueError("Not a packed shift table.")
+        table = cls(row_width, data[cls.header.size :])
+        if len(table) != num_rows:
+            raise ValueError("Truncated packed shift table.")
+        return table
+
+
+def iter_shift_sequence_permutations(
+    valid_shift_sequences, days_in_partial_sequence, num_days
 ):
-    """Get valid shift sequence permutations."""
+    """Yield distinct valid shift sequence permutations.
+
+    Each permutation is a tuple of shifts truncated to the roster period.
+    """
     shift_sequence_end_segments = []
     for valid_shift_sequence in valid_shift_sequences:
         if len(valid_shift_sequence) > days_in_partial_sequence:
@@ -158,161 +231,618 @@ def get_valid_shift_sequence_permutations(
     # Partial days in sequence must be half of size of maximum valid sequence
     repeat = num_days // days_in_partial_sequence
 
-    valid_shift_sequence_permutations_interim = []
-    for shift_sequence in product(valid_shift_sequences, repeat=repeat):
-        valid_shift_sequence_permutations_interim.append(shift_sequence)
-    for shift_sequence in product(valid_shift_sequences, repeat=repeat - 1):
-        for shift_sequence_end_segment in shift_sequence_end_segments:
-            valid_shift_sequence_permutations_interim.append(
-                shift_sequence_end_segment + list(shift_sequence)
+    valid_shift_sequence_permutations_interim = chain(
+        product(valid_shift_sequences, repeat=repeat),
+        (
+            (shift_sequence_end_segment,) + shift_sequence
+            for shift_sequence in product(
+                valid_shift_sequences, repeat=repeat - 1
             )
-
-    valid_shift_sequence_permutations = []
+            for shift_sequence_end_segment in shift_sequence_end_segments
+        ),
+    )
+    seen = set()
     for tuple_of_shift_lists in valid_shift_sequence_permutations_interim:
-        # tuple of lists -> tuple of shifts
-        all_shifts = []
-        for list_of_shifts in tuple_of_shift_lists:
-            for shift in list_of_shifts:
-                all_shifts.append(shift)
         # Truncate to period
-        valid_shift_sequence_permutations.append(tuple(all_shifts[0:num_days]))
-
-    valid_shift_sequence_permutations_booleans = []
+        all_shifts = tuple(
+            islice(chain.from_iterable(tuple_of_shift_lists), num_days)
+        )
+        if all_shifts not in seen:
+            seen.add(all_shifts)
+            yield all_shifts
 
-    for tuple_of_shifts in valid_shift_sequence_permutations:
-        shift_booleans = []
-        for day_num, shift in enumerate(tuple_of_shifts):
-            shifts_on_day_num = get_shifts_on_day_num(
-                day_num + 1, shift_days, shifts
-            )
-            for shift_on_day in shifts_on_day_num:
-                if shift_on_day == shift:
-                    shift_booleans.append(1)
-                else:
-                    shift_booleans.append(0)
-        shift_booleans = tuple(shift_booleans)
-        valid_shift_sequence_permutations_booleans.append(shift_booleans)
 
-    return valid_shift_sequence_permutations_booleans
+def get_valid_shift_sequence_permutations(
+    valid_shift_sequences,
+    days_in_partial_sequence,
+    num_days,
+    shift_calendar,
+    cache_dir=None,
+):
+    """Get valid shift sequence permutations as a packed boolean table.
 
+    Columns are ordered by day then shift, matching the variables passed
+    to enforce_shift_sequences. If cache_dir is given the table is
+    loaded from, or saved to, a cache file keyed by the inputs.
+    """
+    if cache_dir is not None:
+        key = get_input_hash(
+            valid_shift_sequences,
+            days_in_partial_sequence,
+            num_days,
+            shift_calendar.shift_days,
+            shift_calendar.shifts,
+        )
+        cache_path = get_cache_path(cache_dir, "permutations", key)
+        data = read_cache_file(cache_path)
+        if data is not None:
+            return PackedShiftTable.from_bytes(data)
 
-def get_shifts_on_day_num(day_num, shift_days, shifts):
-    """Get list of shifts on day number."""
-    shifts_on_day_num = []
-    for shift in shifts:
-        if day_num in shift_days[shift]:
-            shifts_on_day_num.append(shift)
-    return shifts_on_day_num
+    columns = {}
+    for day_num in range(1, num_days + 1):
+        for shift in shift_calendar.shifts_on_day(day_num):
+            columns[(day_num, shift)] = len(columns)
 
+    valid_shift_sequence_permutations_booleans = PackedShiftTable(len(columns))
+    for tuple_of_shifts in iter_shift_sequence_permutations(
+        valid_shift_sequences, days_in_partial_sequence, num_days
+    ):
+        shift_booleans = 0
+        for day_num, shift in enumerate(tuple_of_shifts):
+            column = columns.get((day_num + 1, shift))
+            if column is not None:
+                shift_booleans |= 1 << column
+        valid_shift_sequence_permutations_booleans.append(shift_booleans)
 
-def get_length_of_list_of_iterables(list_of_tuples):
-    """Get the total length of a list of tuples."""
-    length = 0
-    for tuple_item in list_of_tuples:
-        length += len(tuple_item)
-    return length
+    if cache_dir is not None:
+        write_cache_file(
+            cache_path, valid_shift_sequence_permutations_booleans.to_bytes()
+        )
+    return valid_shift_sequence_permutations_booleans
 
 
 def enforce_shift_sequences(
     staff,
-    shift_vars,
-    shifts,
-    shift_days,
+    work_vars,
+    shift_calendar,
     num_days,
     model,
     valid_shift_sequence_permutations_booleans,
 ):
     """Enforce shift sequences."""
+    # Unpack table once and share it between staff members
+    valid_shift_sequence_permutations_booleans = list(
+        valid_shift_sequence_permutations_booleans
+    )
     staff_list = list(staff.keys())
     for staff_member in staff_list:
-        shift_vars_for_current_period = [
-            shift_vars[(staff_member, role, day, shift)]
-            for role in staff[staff_member]
+        work_vars_for_current_period = [
+            work_vars[(staff_member, day, shift)]
             for day in range(1, num_days + 1)
-            for shift in shifts
-            if day in shift_days[shift] or day - num_days in shift_days[shift]
+            for shift in shift_calendar.shifts_on_day(day)
         ]
-        # Does not currently work if multiple roles
         model.AddAllowedAssignments(
-            shift_vars_for_current_period,
+            work_vars_for_current_period,
             valid_shift_sequence_permutations_booleans,
         )
 
 
-def create_skill_mix_vars(model, shifts, shift_days, skill_mix_rules):
-    """Create skill mix variables."""
+def get_shift_sequence_automaton(
+    valid_shift_sequences, days_in_partial_sequence, shifts
+):
+    """Compile valid shift sequences into a deterministic automaton.
+
+    Automaton states are sets of positions inside the valid shift
+    sequences. As with the permutation table, the roster period may
+    start at the beginning of any sequence or at the end segment of
+    a sequence longer than days_in_partial_sequence, and may finish
+    part way through a sequence. Transition labels are 0 for "X" and
+    the index of the shift in shifts plus one otherwise.
+    """
+    shift_codes = {shift: code + 1 for code, shift in enumerate(shifts)}
+    shift_codes["X"] = 0
+    sequence_starts = frozenset(
+        (seq_num, 0) for seq_num in range(len(valid_shift_sequences))
+    )
+    starting_positions = set(sequence_starts)
+    for seq_num, valid_shift_sequence in enumerate(valid_shift_sequences):
+        if len(valid_shift_sequence) > days_in_partial_sequence:
+            starting_positions.add(
+                (seq_num, len(valid_shift_sequence) - days_in_partial_sequence)
+            )
+    starting_positions = frozenset(starting_positions)
+
+    states = {starting_positions: 0}
+    transition_triples = []
+    unvisited = [starting_positions]
+    while unvisited:
+        positions = unvisited.pop()
+        next_positions_by_shift = {}
+        for seq_num, position in positions:
+            shift = valid_shift_sequences[seq_num][position]
+            next_positions = next_positions_by_shift.setdefault(shift, set())
+            if position + 1 == len(valid_shift_sequences[seq_num]):
+                next_positions.update(sequence_starts)
+            else:
+                next_positions.add((seq_num, position + 1))
+        for shift, next_positions in next_positions_by_shift.items():
+            next_positions = frozenset(next_positions)
+            if next_positions not in states:
+                states[next_positions] = len(states)
+                unvisited.append(next_positions)
+            transition_triples.append(
+                (states[positions], shift_codes[shift], states[next_positions])
+            )
+    # Roster period may end part way through a sequence
+    final_states = list(states.values())
+    return 0, final_states, transition_triples
+
+
+def enforce_shift_sequences_automaton(
+    staff,
+    work_vars,
+    shift_calendar,
+    num_days,
+    model,
+    shift_sequence_automaton,
+):
+    """Enforce shift sequences with an automaton constraint.
+
+    As with the permutation table, a sequence may place a shift on a
+    day it does not run, which counts as a day off: the day's shift
+    code can then take that shift's code with no work variable set.
+    """
+    starting_state, final_states, transition_triples = shift_sequence_automaton
+    shift_codes = {
+        shift: code + 1 for code, shift in enumerate(shift_calendar.shifts)
+    }
+    for staff_member in staff:
+        day_shift_vars = []
+        for day in range(1, num_days + 1):
+            day_shift_var = model.NewIntVar(
+                0,
+                len(shift_codes),
+                f"staff:{staff_member}_day:{day}_shift_code",
+            )
+            for shift in shift_calendar.shifts_on_day(day):
+                work_var = work_vars[(staff_member, day, shift)]
+                model.Add(day_shift_var == shift_codes[shift]).OnlyEnforceIf(
+                    work_var
+                )
+                model.Add(day_shift_var != shift_codes[shift]).OnlyEnforceIf(
+                    work_var.Not()
+                )
+            day_shift_vars.append(day_shift_var)
+        model.AddAutomaton(
+            day_shift_vars, starting_state, final_states, transition_triples
+        )
+
+
+def get_shift_sequence_blocks(
+    valid_shift_sequences, days_in_partial_sequence
+):
+    """Split valid shift sequences into blocks of days_in_partial_sequence.
+
+    Returns a list of (shifts, next_block) pairs, where next_block is
+    the number of the block that must follow, or None if the sequence
+    ends and any sequence can start. As with the permutation table, the
+    roster period may start at the beginning of any sequence or at its
+    last block. Raises ValueError if a sequence is not a whole number of
+    blocks.
+    """
+    blocks = []
+    for valid_shift_sequence in dict.fromkeys(
+        tuple(valid_shift_sequence)
+        for valid_shift_sequence in valid_shift_sequences
+    ):
+        if len(valid_shift_sequence) % days_in_partial_sequence:
+            raise ValueError(
+                f"Valid shift sequence {list(valid_shift_sequence)} is "
+                f"not a multiple of {days_in_partial_sequence} days"
+            )
+        num_blocks = len(valid_shift_sequence) // days_in_partial_sequence
+        for block_num in range(num_blocks):
+            start = block_num * days_in_partial_sequence
+            blocks.append(
+                (
+                    valid_shift_sequence[
+                        start : start + days_in_partial_sequence
+                    ],
+                    len(blocks) + 1 if block_num + 1 < num_blocks else None,
+                )
+            )
+    return blocks
+
+
+def enforce_shift_sequence_blocks(
+    staff,
+    work_vars,
+    shift_calendar,
+    num_days,
+    model,
+    shift_sequence_blocks,
+):
+    """Enforce shift sequences by choosing a block for each week.
+
+    Each staff member works exactly one block of a valid shift sequence
+    in each week, and their work variables are the sum of the block
+    variables with that shift on that day. A shift in a block on a day
+    it does not run is a day off, as in the permutation table. Returns
+    the block variables keyed by staff member, week from 0 and block
+    number.
+    """
+    days_in_block = len(shift_sequence_blocks[0][0])
+    num_weeks = -(-num_days // days_in_block)
+    previous_blocks = {
+        next_block: block_num
+        for block_num, (_, next_block) in enumerate(shift_sequence_blocks)
+        if next_block is not None
+    }
+    # The first week starts a sequence or works the last block of one,
+    # later weeks may continue any block worked the week before
+    weekly_blocks = [
+        [
+            block_num
+            for block_num, (_, next_block) in enumerate(shift_sequence_blocks)
+            if block_num not in previous_blocks or next_block is None
+        ]
+    ]
+    for week in range(1, num_weeks):
+        weekly_blocks.append(
+            [
+                block_num
+                for block_num in range(len(shift_sequence_blocks))
+                if block_num not in previous_blocks
+                or previous_blocks[block_num] in weekly_blocks[-1]
+            ]
+        )
+    block_vars = {}
+    for staff_member in staff:
+        for week, blocks in enumerate(weekly_blocks):
+            for block_num in blocks:
+                block_vars[(staff_member, week, block_num)] = model.NewBoolVar(
+                    f"staff:{staff_member}_week:{week + 1}_block:{block_num}"
+                )
+            model.AddExactlyOne(
+                block_vars[(staff_member, week, block_num)]
+                for block_num in blocks
+            )
+            if week == 0:
+                continue
+            for block_num in blocks:
+                block_var = block_vars[(staff_member, week, block_num)]
+                if block_num in previous_blocks:
+                    # Blocks after the first of a sequence follow the one
+                    # before it, and it is always followed by them
+                    previous_block_var = block_vars[
+                        (staff_member, week - 1, previous_blocks[block_num])
+                    ]
+                    model.Add(block_var == previous_block_var)
+        for day in range(1, num_days + 1):
+            week, position = divmod(day - 1, days_in_block)
+            for shift in shift_calendar.shifts_on_day(day):
+                model.Add(
+                    work_vars[(staff_member, day, shift)]
+                    == sum(
+                        block_vars[(staff_member, week, block_num)]
+                        for block_num in weekly_blocks[week]
+                        if shift_sequence_blocks[block_num][0][position]
+                        == shift
+                    )
+                )
+    return block_vars
+
+
+def get_interchangeable_staff(compact_instance):
+    """Get groups of staff members who can swap rosters.
+
+    Staff members are interchangeable if they have the same roles and
+    worked the same shifts in the previous period.
+    """
+    groups = {}
+    for staff_member, roles, shift_codes in zip(
+        compact_instance.staff,
+        compact_instance.staff_roles,
+        compact_instance.history,
+    ):
+        groups.setdefault((roles, shift_codes.tobytes()), []).append(
+            staff_member
+        )
+    return [group for group in groups.values() if len(group) > 1]
+
+
+def enforce_symmetry_breaking(
+    interchangeable_staff,
+    work_vars,
+    shift_calendar,
+    unpleasant_shifts,
+    model,
+    assignment=None,
+):
+    """Order unpleasant shifts of interchangeable staff members.
+
+    Swapping the rosters of interchangeable staff members gives an
+    equivalent roster, so within each group the weighted number of
+    unpleasant shifts must not increase. If an assignment is given, such as a
+    solution hint, each group is ordered so the assignment is allowed,
+    counting its last num_days shifts as add_solution_hints does.
+    """
+    weights = get_unpleasant_shift_weights(unpleasant_shifts)
+    for group in interchangeable_staff:
+        if assignment is not None:
+            group = sorted(
+                group,
+                key=lambda staff_member: sum(
+                    weights.get(shift, 0)
+                    for shift in assignment.get(staff_member, ())[
+                        -shift_calendar.num_days :
+                    ]
+                ),
+                reverse=True,
+            )
+        unpleasant_shift_counts = [
+            sum(
+                weight * work_vars[(staff_member, day, shift)]
+                for shift, weight in weights.items()
+                for day in shift_calendar.days(shift)
+            )
+            for staff_member in group
+        ]
+        for larger_count, smaller_count in zip(
+            unpleasant_shift_counts, unpleasant_shift_counts[1:]
+        ):
+            model.Add(larger_count >= smaller_count)
+
+
+def get_role_staff(staff):
+    """Get staff members with each role."""
+    role_staff = {}
+    for staff_member, roles in staff.items():
+        for role in roles:
+            role_staff.setdefault(role, []).append(staff_member)
+    return role_staff
+
+
+def split_skill_mix_rules(shift, rules):
+    """Split the skill mix rules of a shift into fixed and alternative counts.
+
+    Roles counted the same by every rule have fixed counts. Returns
+    those counts and the rules without them, which are alternatives
+    unless a rule has no other roles, leaving nothing to choose. Raises
+    ValueError if the shift has no rules.
+    """
+    if not rules:
+        raise ValueError(f"Shift {shift} has no skill mix rules")
+    fixed_counts = {
+        role: count
+        for role, count in rules[0].items()
+        if all(rule.get(role) == count for rule in rules)
+    }
+    alternatives = tuple(
+        {
+            role: count
+            for role, count in rule.items()
+            if role not in fixed_counts
+        }
+        for rule in rules
+    )
+    if not all(alternatives):
+        return fixed_counts, ()
+    return fixed_counts, alternatives
+
+
+def get_alternative_role(alternatives):
+    """Get the only role alternative skill mix rules count.
+
+    Alternatives over one role restrict its count to a domain. Returns
+    None if they count several roles, so each needs a skill mix variable.
+    """
+    role_tuples = {tuple(rule) for rule in alternatives}
+    if len(role_tuples) == 1:
+        (roles,) = role_tuples
+        if len(roles) == 1:
+            return roles[0]
+    return None
+
+
+def needs_skill_mix_vars(shift, rules):
+    """Whether skill mix rules of a shift need a variable per rule."""
+    _, alternatives = split_skill_mix_rules(shift, rules)
+    return bool(alternatives) and get_alternative_role(alternatives) is None
+
+
+def create_skill_mix_vars(model, shifts, shift_calendar, skill_mix_rules):
+    """Create skill mix variables for shifts whose rules need them."""
     skill_mix_vars = {
         (day, shift, rule_num): model.NewBoolVar(
             f"day:{day}_shift:{shift}_rule:{rule_num}"
         )
         for shift in shifts
-        for day in shift_days[shift]
+        if needs_skill_mix_vars(shift, skill_mix_rules[shift])
+        for day in shift_calendar.days(shift)
         for rule_num, rule in enumerate(skill_mix_rules[shift])
     }
     return skill_mix_vars
 
 
 def enforce_one_skill_mix_rule_per_shift(
-    shifts, shift_days, skill_mix_vars, skill_mix_rules, model
+    shifts, shift_calendar, skill_mix_vars, skill_mix_rules, model
 ):
     """Enforce at least one skill mix rule per shift on a particular day."""
     for shift in shifts:
-        for day in shift_days[shift]:
-            skill_mix_vars_for_shift_day = [
+        if not needs_skill_mix_vars(shift, skill_mix_rules[shift]):
+            continue
+        for day in shift_calendar.days(shift):
+            model.AddBoolOr(
                 skill_mix_vars[(day, shift, rule_num)]
-                for rule_num, rule in enumerate(skill_mix_rules[shift])
-            ]
-            model.Add(sum(skill_mix_vars_for_shift_day) >= 1)
+                for rule_num in range(len(skill_mix_rules[shift]))
+            )
 
 
 def enforce_skill_mix_rules(
     shifts,
     skill_mix_rules,
-    shift_days,
+    shift_calendar,
     model,
     shift_vars,
     staff,
     skill_mix_vars,
 ):
-    """Enforce skill mix rules."""
+    """Enforce skill mix rules.
+
+    Each role count is built once per shift and day from a role to staff
+    index. Counts fixed by every rule are constrained directly, and
+    alternatives over one role restrict its count to a domain. Only
+    alternatives over several roles are enforced by skill mix variables.
+    """
+    role_staff = get_role_staff(staff)
     for shift in shifts:
-        for rule_num, rule in enumerate(skill_mix_rules[shift]):
-            for role in rule:
-                for day in shift_days[shift]:
-                    role_count = rule[role]
-                    model.Add(
-                        sum(
-                            shift_vars[(staff_member, role, day, shift)]
-                            for staff_member in staff
-                            if role in staff[staff_member]
-                        )
-                        == role_count
-                    ).OnlyEnforceIf(skill_mix_vars[(day, shift, rule_num)])
+        fixed_counts, alternatives = split_skill_mix_rules(
+            shift, skill_mix_rules[shift]
+        )
+        alternative_role = get_alternative_role(alternatives)
+        roles = list(fixed_counts)
+        for rule in alternatives:
+            roles.extend(role for role in rule if role not in roles)
+        for day in shift_calendar.days(shift):
+            role_counts = {
+                role: sum(
+                    shift_vars[(staff_member, role, day, shift)]
+                    for staff_member in role_staff.get(role, ())
+                )
+                for role in roles
+            }
+            for role, count in fixed_counts.items():
+                model.Add(role_counts[role] == count)
+            if not alternatives:
+                continue
+            if alternative_role is not None:
+                counts = {rule[alternative_role] for rule in alternatives}
+                model.AddLinearExpressionInDomain(
+                    role_counts[alternative_role],
+                    cp_model.Domain.FromValues(sorted(counts)),
+                )
+                continue
+            for rule_num, rule in enumerate(alternatives):
+                for role, count in rule.items():
+                    model.Add(role_counts[role] == count).OnlyEnforceIf(
+                        skill_mix_vars[(day, shift, rule_num)]
+                    )
+
+
+def get_unpleasant_shift_weights(unpleasant_shifts):
+    """Get weight of each unpleasant shift.
+
+    unpleasant_shifts is either a list of shifts, each with weight 1,
+    or a dict of integer weights by shift.
+    """
+    if isinstance(unpleasant_shifts, dict):
+        return dict(unpleasant_shifts)
+    return {shift: 1 for shift in unpleasant_shifts}
+
+
+def get_unpleasant_shift_weights_by_code(compact_instance, unpleasant_shifts):
+    """Get array of unpleasant shift weights indexed by shift code."""
+    weights_by_code = np.zeros(len(compact_instance.shifts) + 1)
+    for shift, weight in get_unpleasant_shift_weights(
+        unpleasant_shifts
+    ).items():
+        weights_by_code[compact_instance.shift_codes[shift]] = weight
+    return weights_by_code
+
+
+def get_previous_unpleasant_shift_counts(
+    compact_instance,
+    unpleasant_shifts,
+    num_days,
+    fairness_days=None,
+    fairness_decay=1.0,
+    skip_days=0,
+):
+    """Count weighted unpleasant shifts worked in previous days.
+
+    Counts cover the last fairness_days days of history, by default the
+    previous roster period, leaving out the most recent skip_days days.
+    Shifts in each earlier roster period count fairness_decay times as
+    much as those in the period after it. Counts are rounded to whole
+    shifts.
+    """
+    if fairness_days is None:
+        fairness_days = num_days
+    num_history_days = compact_instance.history.shape[1]
+    history = compact_instance.history[
+        :, max(0, num_history_days - fairness_days) :
+    ]
+    weights_by_code = get_unpleasant_shift_weights_by_code(
+        compact_instance, unpleasant_shifts
+    )
+    ages = np.arange(history.shape[1], 0, -1)
+    day_weights = fairness_decay ** ((ages - 1) // num_days)
+    day_weights[ages <= skip_days] = 0
+    counts = (weights_by_code[history] * day_weights).sum(axis=1)
+    return dict(
+        zip(compact_instance.staff, np.rint(counts).astype(int).tolist())
+    )
 
 
 def configure_objective(
-    model, shift_vars, staff, unpleasant_shifts, num_days, shift_days,
+    model,
+    work_vars,
+    staff,
+    unpleasant_shifts,
+    num_days,
+    shift_calendar,
+    previous_unpleasant_shift_counts=None,
+    historical_unpleasant_shift_counts=None,
 ):
     """Configure objective function.
 
     Need to allocate unpleasant shifts fairly so minimise
     total number of unpleasant shifts over previous and
-    current roster periods. Can add weights to different
-    unpleasant shifts if desired.
+    current roster periods, weighted by shift if
+    unpleasant_shifts gives weights. If previous unpleasant
+    shift counts are given they are used as constants in
+    place of previous shift variables. Historical counts
+    for days before the previous period are added as
+    constants, so a long fairness horizon does not grow
+    the model.
     """
+    weights = get_unpleasant_shift_weights(unpleasant_shifts)
+    historical_unpleasant_shift_counts = (
+        historical_unpleasant_shift_counts or {}
+    )
+    constants = [
+        (previous_unpleasant_shift_counts or {}).get(staff_member, 0)
+        + historical_unpleasant_shift_counts.get(staff_member, 0)
+        for staff_member in staff
+    ]
+    # Current period, and previous period unless given as constants
+    periods_of_variables = 2 if previous_unpleasant_shift_counts is None else 1
     max_unpleasant_shifts = model.NewIntVar(
-        0, 2 * num_days, "max_unpleasant_shifts"
+        0,
+        max(constants, default=0)
+        + periods_of_variables * max(weights.values(), default=0) * num_days,
+        "max_unpleasant_shifts",
     )
 
     for staff_member in staff:
+        if previous_unpleasant_shift_counts is None:
+            previous_unpleasant_shifts = sum(
+                weight * work_vars[(staff_member, day, shift)]
+                for shift, weight in weights.items()
+                for day in shift_calendar.previous_days(shift)
+            )
+        else:
+            previous_unpleasant_shifts = previous_unpleasant_shift_counts[
+                staff_member
+            ]
         model.Add(
-            sum(
-                shift_vars[(staff_member, role, day, shift)]
-                for role in staff[staff_member]
-                for shift in unpleasant_shifts
-                for day in range(-num_days + 1, num_days + 1)
-                if day in shift_days[shift]
-                or day + num_days in shift_days[shift]
+            previous_unpleasant_shifts
+            + historical_unpleasant_shift_counts.get(staff_member, 0)
+            + sum(
+                weight * work_vars[(staff_member, day, shift)]
+                for shift, weight in weights.items()
+                for day in shift_calendar.days(shift)
             )
             <= max_unpleasant_shifts
         )
@@ -321,10 +851,197 @@ def configure_objective(
     return max_unpleasant_shifts
 
 
-def solve(model):
-    """Solve model."""
+def add_solution_hints(
+    model,
+    shift_vars,
+    skill_mix_vars,
+    staff,
+    assignment,
+    shift_calendar,
+    skill_mix_rules,
+    num_days,
+):
+    """Add solution hints from an existing assignment.
+
+    The assignment maps staff members to a list of shifts ending with
+    days 1 to num_days, with "X" for days off, e.g. a published roster
+    or previous_shifts, which may have longer history. Staff missing
+    from the assignment are not hinted. Shifts are hinted against each
+    staff member's first role.
+    """
+    role_counts = {}
+    for staff_member, shifts_worked in assignment.items():
+        if staff_member not in staff:
+            continue
+        hinted_role = staff[staff_member][0]
+        for day, shift_worked in enumerate(
+            shifts_worked[-num_days:], start=1
+        ):
+            for shift in shift_calendar.shifts_on_day(day):
+                for role in staff[staff_member]:
+                    works_shift = shift == shift_worked and role == hinted_role
+                    model.AddHint(
+                        shift_vars[(staff_member, role, day, shift)],
+                        works_shift,
+                    )
+                    if works_shift:
+                        role_counts.setdefault((day, shift), {})
+                        role_counts[(day, shift)].setdefault(role, 0)
+                        role_counts[(day, shift)][role] += 1
+
+    for (day, shift, rule_num), skill_mix_var in skill_mix_vars.items():
+        rule = skill_mix_rules[shift][rule_num]
+        counts = role_counts.get((day, shift), {})
+        model.AddHint(
+            skill_mix_var,
+            all(counts.get(role, 0) == rule[role] for role in rule),
+        )
+
+
+def enforce_unavailability(unavailability, shift_calendar, model, work_vars):
+    """Enforce no shifts on days staff members are unavailable."""
+    for staff_member, days in unavailability.items():
+        for day in days:
+            for shift in shift_calendar.shifts_on_day(day):
+                model.Add(work_vars[(staff_member, day, shift)] == 0)
+
+
+def enforce_locked_shifts(
+    assignment, locked_days, shift_calendar, model, work_vars
+):
+    """Enforce shifts in an existing assignment on locked days.
+
+    locked_days maps staff members to the days on which their shifts
+    are fixed to the assignment.
+    """
+    for staff_member, days in locked_days.items():
+        for day in days:
+            shift_worked = assignment[staff_member][day - 1]
+            for shift in shift_calendar.shifts_on_day(day):
+                model.Add(
+                    work_vars[(staff_member, day, shift)]
+                    == int(shift == shift_worked)
+                )
+
+
+# Solver profile keys are CP-SAT SatParameters field names, None means
+# use the solver default.
+DEFAULT_SOLVER_PROFILE = {
+    "num_workers": 0,
+    "max_time_in_seconds": None,
+    "relative_gap_limit": None,
+    "random_seed": None,
+    "log_search_progress": False,
+}
+
+DEFAULT_PROFILE_DIR = os.path.join(
+    os.path.expanduser("~"), ".config", "miniroster", "profiles"
+)
+
+
+def save_solver_profile(name, solver_profile, profile_dir=None):
+    """Save solver profile under a name."""
+    profile_dir = profile_dir or DEFAULT_PROFILE_DIR
+    os.makedirs(profile_dir, exist_ok=True)
+    with open(os.path.join(profile_dir, f"{name}.json"), "w") as profile_file:
+        json.dump(solver_profile, profile_file, indent=2)
+
+
+def load_solver_profile(name, profile_dir=None):
+    """Load solver profile saved under a name."""
+    profile_dir = profile_dir or DEFAULT_PROFILE_DIR
+    with open(os.path.join(profile_dir, f"{name}.json")) as profile_file:
+        return json.load(profile_file)
+
+
+def resolve_solver_profile(solver_profile):
+    """Get solver profile dict from a profile or the name of a saved one."""
+    if isinstance(solver_profile, str):
+        return load_solver_profile(solver_profile)
+    return dict(solver_profile or {})
+
+
+def get_process_solver_profile(solver_profile, num_processes):
+    """Get the solver profile for each of num_processes processes.
+
+    Unless the solver profile sets num_workers, the cores are shared
+    between the processes.
+    """
+    solver_profile = resolve_solver_profile(solver_profile)
+    solver_profile.setdefault(
+        "num_workers", max(1, (os.cpu_count() or 1) // num_processes)
+    )
+    return solver_profile
+
+
+class IncumbentCallback(cp_model.CpSolverSolutionCallback):
+    """Pass each improving solution found during search to a function.
+
+    The function is called with this callback, which can be queried
+    with Value() in the same way as a solver.
+    """
+
+    def __init__(self, on_incumbent):
+        cp_model.CpSolverSolutionCallback.__init__(self)
+        self.on_incumbent = on_incumbent
+        self.num_incumbents = 0
+
+    def on_solution_callback(self):
+        """Handle new incumbent."""
+        self.num_incumbents += 1
+        log.info(
+            f"Incumbent {self.num_incumbents} with objective "
+            f"{self.ObjectiveValue()} after {self.WallTime():.2f}s"
+        )
+        self.on_incumbent(self)
+
+
+def create_solver(solver_profile=None):
+    """Create solver configured from solver profile.
+
+    The solver profile can be the name of a saved profile. Enum
+    parameters such as search_branching are given by name.
+    """
     solver = cp_model.CpSolver()
-    solution_status = solver.Solve(model)
+    solver_profile = {
+        **DEFAULT_SOLVER_PROFILE,
+        **resolve_solver_profile(solver_profile),
+    }
+    for parameter, value in solver_profile.items():
+        if value is None:
+            continue
+        if isinstance(value, str):
+            enum_type = type(getattr(solver.parameters, parameter))
+            value = getattr(enum_type, value, value)
+        setattr(solver.parameters, parameter, value)
+    return solver
+
+
+def solve(model, solver_profile=None, incumbent_callback=None, telemetry=None):
+    """Solve model.
+
+    If incumbent_callback is given it is called with each improving
+    solution so the caller can keep the best roster found so far. If a
+    SolveTelemetry is given it records the search, including solves
+    that find no roster.
+    """
+    solver = create_solver(solver_profile)
+    if telemetry is not None:
+        telemetry.attach(solver)
+
+        def on_incumbent(callback):
+            telemetry.on_incumbent(callback)
+            if incumbent_callback is not None:
+                incumbent_callback(callback)
+
+        solution_status = solver.Solve(model, IncumbentCallback(on_incumbent))
+        telemetry.record_response(solver)
+    elif incumbent_callback is None:
+        solution_status = solver.Solve(model)
+    else:
+        solution_status = solver.Solve(
+            model, IncumbentCallback(incumbent_callback)
+        )
     if solution_status == cp_model.INFEASIBLE:
         log.info("Solution is INFEASIBLE")
     if solution_status == cp_model.MODEL_INVALID:
@@ -342,59 +1059,3 @@ def solve(model):
         log.info("No feasible solution, raising exception...")
         raise SolutionNotFeasible("No feasible solutions.")
     return solver
-
-
-def display_shifts_by_day(
-    num_days, shifts, shift_days, staff, shift_vars, solver
-):
-    """Display shifts by day."""
-    for day in range(1 - num_days, num_days + 1):
-        print(f"Day {day}: ", end="")
-        for shift in shifts:
-            if day in shift_days[shift] or day + num_days in shift_days[shift]:
-                print(f"{shift}: ", end="")
-            for staff_member in staff:
-                for role in staff[staff_member]:
-                    if (staff_member, role, day, shift) in shift_vars:
-                        if (
-                            solver.Value(
-                                shift_vars[(staff_member, role, day, shift)]
-                            )
-                            == 1
-                        ):
-                            print(f"{staff_member} ", end="")
-        print()
-
-
-def display_shifts_by_staff(
-    num_days,
-    shifts,
-    shift_days,
-    staff,
-    shift_vars,
-    solver,
-    max_unpleasant_shifts,
-):
-    """Display shifts by staff."""
-    for staff_member in staff:
-        print(f"{staff_member}: ", end="")
-        for day in range(1, num_days + 1):
-            shift_worked = "X"
-            for shift in shifts:
-                if day in shift_days[shift]:
-                    for role in staff[staff_member]:
-
-                        if (
-                            solver.Value(
-                                shift_vars[(staff_member, role, day, shift)]
-                            )
-                            == 1
-                        ):
-                            shift_worked = shift
-            print(f"{shift_worked:2} ", end="")
-
-        print()
-    print(
-        f"Maximum unpleasant shifts over previous "
-        f"and current period is {solver.Value(max_unpleasant_shifts)}"
-    )
@@ -0,0 +1,256 @@
+"""On-disk cache of built roster2 models.
+
+Models are only cached where OR-Tools can serialise them as binary, as
+parsing the text format fallback is slower than building most models.
+The least recently used models beyond DEFAULT_MAX_MODELS are removed.
+Run as a script to check that a built model solves the same after a
+round trip through the cache format.
+"""
+import argparse
+import json
+import logging
+import os
+import time
+import zlib
+
+import ortools
+from ortools.sat.python import cp_model
+
+from builder import RosterModel, build_model, get_default_instance
+from cache import (
+    can_serialise_binary,
+    evict_cache_files,
+    get_cache_path,
+    get_input_hash,
+    parse_model,
+    read_cache_file,
+    serialise_model,
+    write_cache_file,
+)
+from compact import CompactInstance
+from instrumentation import BuildReport
+from logic import get_work_var_indexes, solve
+from result import RosterResult
+from shift_calendar import ShiftCalendar
+
+log = logging.getLogger("roster")
+
+# Increment when the structure of built models changes so stale cached
+# models are not loaded
+MODEL_CACHE_VERSION = 5
+
+DEFAULT_MAX_MODELS = 32
+
+
+def roster_model_to_bytes(roster_model):
+    """Serialise roster model with its variable index maps."""
+    variable_indexes = {
+        "shift_vars": [
+            [*key, var.Index()] for key, var in roster_model.shift_vars.items()
+        ],
+        "work_vars": [
+            [*key, var.Index()] for key, var in roster_model.work_vars.items()
+        ],
+        "skill_mix_vars": [
+            [*key, var.Index()]
+            for key, var in roster_model.skill_mix_vars.items()
+        ],
+        "max_unpleasant_shifts": roster_model.max_unpleasant_shifts.Index(),
+        "previous_unpleasant_shift_counts": (
+            roster_model.previous_unpleasant_shift_counts
+        ),
+    }
+    encoded_indexes = json.dumps(variable_indexes).encode()
+    return zlib.compress(
+        len(encoded_indexes).to_bytes(8, "little")
+        + encoded_indexes
+        + serialise_model(roster_model.model),
+        1,
+    )
+
+
+def roster_model_from_bytes(data, instance):
+    """Deserialise roster model for instance."""
+    data = zlib.decompress(data)
+    index_size = int.from_bytes(data[:8], "little")
+    variable_indexes = json.loads(data[8 : 8 + index_size])
+    model = parse_model(data[8 + index_size :])
+    shift_vars = {
+        tuple(key): model.GetBoolVarFromProtoIndex(index)
+        for *key, index in variable_indexes["shift_vars"]
+    }
+    work_vars = {
+        tuple(key): model.GetBoolVarFromProtoIndex(index)
+        for *key, index in variable_indexes["work_vars"]
+    }
+    skill_mix_vars = {
+        tuple(key): model.GetBoolVarFromProtoIndex(index)
+        for *key, index in variable_indexes["skill_mix_vars"]
+    }
+    max_unpleasant_shifts = model.GetIntVarFromProtoIndex(
+        variable_indexes["max_unpleasant_shifts"]
+    )
+    shift_calendar = ShiftCalendar(
+        instance["num_days"], instance["shifts"], instance["shift_days"]
+    )
+    compact_instance = CompactInstance(instance)
+    work_var_indexes = get_work_var_indexes(
+        compact_instance, work_vars, instance["num_days"]
+    )
+    return RosterModel(
+        instance,
+        model,
+        shift_calendar,
+        compact_instance,
+        shift_vars,
+        work_vars,
+        work_var_indexes,
+        skill_mix_vars,
+        max_unpleasant_shifts,
+        previous_unpleasant_shift_counts=variable_indexes[
+            "previous_unpleasant_shift_counts"
+        ],
+    )
+
+
+def get_model_cache_key(instance, **build_options):
+    """Get cache key for a model built from instance with options."""
+    return get_input_hash(
+        MODEL_CACHE_VERSION, ortools.__version__, instance, build_options
+    )
+
+
+def build_model_cached(
+    instance,
+    cache_dir,
+    sequence_engine="table",
+    history_mode="variables",
+    hint_assignment=None,
+    symmetry_breaking=True,
+    fairness_days=None,
+    fairness_decay=1.0,
+    max_models=DEFAULT_MAX_MODELS,
+):
+    """Load model for roster instance from cache, building it if needed.
+
+    Models are not cached if cache_dir is None or OR-Tools cannot
+    serialise them as binary. At most max_models models are kept.
+    """
+    if cache_dir is None or not can_serialise_binary(cp_model.CpModel()):
+        # The permutation table cache is still used
+        return build_model(
+            instance,
+            sequence_engine=sequence_engine,
+            cache_dir=cache_dir,
+            history_mode=history_mode,
+            hint_assignment=hint_assignment,
+            symmetry_breaking=symmetry_breaking,
+            fairness_days=fairness_days,
+            fairness_decay=fairness_decay,
+        )
+    key = get_model_cache_key(
+        instance,
+        sequence_engine=sequence_engine,
+        history_mode=history_mode,
+        hint_assignment=hint_assignment,
+        symmetry_breaking=symmetry_breaking,
+        fairness_days=fairness_days,
+        fairness_decay=fairness_decay,
+    )
+    cache_path = get_cache_path(cache_dir, "model", key)
+    data = read_cache_file(cache_path)
+    if data is not None:
+        start_time = time.perf_counter()
+        roster_model = roster_model_from_bytes(data, instance)
+        try:
+            # Mark as recently used for eviction
+            os.utime(cache_path)
+        except FileNotFoundError:
+            pass
+        build_report = BuildReport(roster_model.model)
+        build_report.stages.append(
+            {
+                "stage": "load_cached_model",
+                "wall_time": time.perf_counter() - start_time,
+                "variables_added": len(roster_model.model.Proto().variables),
+                "constraints_added": len(
+                    roster_model.model.Proto().constraints
+                ),
+            }
+        )
+        roster_model.build_report = build_report
+        return roster_model
+    roster_model = build_model(
+        instance,
+        sequence_engine=sequence_engine,
+        cache_dir=cache_dir,
+        history_mode=history_mode,
+        hint_assignment=hint_assignment,
+        symmetry_breaking=symmetry_breaking,
+        fairness_days=fairness_days,
+        fairness_decay=fairness_decay,
+    )
+    write_cache_file(cache_path, roster_model_to_bytes(roster_model))
+    evict_cache_files(cache_dir, "model", max_models)
+    return roster_model
+
+
+def check_round_trip(instance=None, solver_profile=None, **build_options):
+    """Check a model solves the same after a round trip through the cache.
+
+    The instance, by default data.py, is built with build_options,
+    serialised and parsed as cached models are, whether or not this
+    OR-Tools version would cache it, and both models are solved.
+    Returns the maximum unpleasant shifts, raising ValueError if the
+    parsed model solves differently.
+    """
+    if instance is None:
+        instance = get_default_instance()
+    roster_model = build_model(instance, **build_options)
+    parsed_roster_model = roster_model_from_bytes(
+        roster_model_to_bytes(roster_model), instance
+    )
+    max_unpleasant_shifts = [
+        RosterResult.from_solver(
+            model, solve(model.model, solver_profile)
+        ).max_unpleasant_shifts
+        for model in (roster_model, parsed_roster_model)
+    ]
+    if max_unpleasant_shifts[0] != max_unpleasant_shifts[1]:
+        raise ValueError(
+            f"Parsed model has maximum unpleasant shifts "
+            f"{max_unpleasant_shifts[1]}, built model "
+            f"{max_unpleasant_shifts[0]}"
+        )
+    return max_unpleasant_shifts[0]
+
+
+if __name__ == "__main__":
+    from roster import (
+        add_instance_arguments,
+        add_model_arguments,
+        add_solver_arguments,
+        get_instance,
+        get_solver_profile,
+        setup_logging,
+    )
+
+    setup_logging()
+    parser = argparse.ArgumentParser(description=__doc__)
+    add_instance_arguments(parser)
+    add_model_arguments(parser)
+    add_solver_arguments(parser)
+    args = parser.parse_args()
+    max_unpleasant_shifts = check_round_trip(
+        get_instance(args),
+        get_solver_profile(args),
+        sequence_engine=args.sequence_engine,
+        history_mode=args.history_mode,
+        symmetry_breaking=not args.no_symmetry_breaking,
+        fairness_days=args.fairness_days,
+        fairness_decay=args.fairness_decay,
+    )
+    log.info(
+        f"Model cache round trip solves to {max_unpleasant_shifts} "
+        f"with OR-Tools {ortools.__version__}"
+    )
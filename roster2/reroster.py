@@ -0,0 +1,260 @@
+"""Incremental re-rostering for mini roster 2.
+
+Re-optimises only the part of an existing roster disrupted by staff
+changes, keeping everything outside a window of days and a
+neighbourhood of affected staff locked to the existing roster.
+"""
+import argparse
+import json
+import logging
+
+from cache import DEFAULT_CACHE_DIR
+from logic import (
+    SolutionNotFeasible,
+    enforce_locked_shifts,
+    enforce_unavailability,
+    solve,
+)
+from model_cache import build_model_cached
+from result import RosterResult
+from roster import (
+    add_instance_arguments,
+    add_model_arguments,
+    add_output_arguments,
+    add_solver_arguments,
+    get_instance,
+    get_output_paths,
+    get_solver_profile,
+    setup_logging,
+    write_result,
+)
+
+log = logging.getLogger("roster")
+
+
+def apply_roster_changes(instance, assignment, changes):
+    """Apply staff changes to an instance and its existing assignment.
+
+    changes may contain "unavailable" mapping staff members to days off,
+    "new_staff" mapping new staff members to their "roles" and optional
+    "previous_shifts", and "removed_staff" listing staff members who
+    have left. Returns the changed instance and assignment.
+    """
+    num_days = instance["num_days"]
+    # New staff without history have as many days off as others' history
+    num_history_days = max(
+        map(len, instance["previous_shifts"].values()), default=num_days
+    )
+    removed_staff = set(changes.get("removed_staff", ()))
+    new_staff = changes.get("new_staff", {})
+    staff = {
+        staff_member: roles
+        for staff_member, roles in instance["staff"].items()
+        if staff_member not in removed_staff
+    }
+    previous_shifts = {
+        staff_member: shifts_worked
+        for staff_member, shifts_worked in instance["previous_shifts"].items()
+        if staff_member not in removed_staff
+    }
+    assignment = {
+        staff_member: shifts_worked
+        for staff_member, shifts_worked in assignment.items()
+        if staff_member not in removed_staff
+    }
+    for staff_member, details in new_staff.items():
+        staff[staff_member] = details["roles"]
+        previous_shifts[staff_member] = details.get(
+            "previous_shifts", ["X"] * num_history_days
+        )
+        assignment[staff_member] = ["X"] * num_days
+    return {
+        **instance,
+        "staff": staff,
+        "previous_shifts": previous_shifts,
+    }, assignment
+
+
+def get_reroster_window(changes, num_days):
+    """Get first and last day that can change for a set of changes."""
+    if changes.get("new_staff") or changes.get("removed_staff"):
+        return 1, num_days
+    unavailable_days = [
+        day for days in changes.get("unavailable", {}).values() for day in days
+    ]
+    if not unavailable_days:
+        return 1, num_days
+    return min(unavailable_days), num_days
+
+
+def get_affected_staff(
+    instance, assignment, changed_staff, changed_roles, neighbourhood_size
+):
+    """Get staff members whose shifts can change.
+
+    These are the changed staff members plus up to neighbourhood_size
+    other staff members sharing one of the changed roles, preferring
+    those with the fewest unpleasant shifts.
+    """
+    unpleasant_shifts = instance["unpleasant_shifts"]
+    candidates = sorted(
+        (
+            staff_member
+            for staff_member, roles in instance["staff"].items()
+            if staff_member not in changed_staff
+            and changed_roles.intersection(roles)
+        ),
+        key=lambda staff_member: sum(
+            1
+            for shift in instance["previous_shifts"][staff_member]
+            + assignment[staff_member]
+            if shift in unpleasant_shifts
+        ),
+    )
+    return changed_staff | set(candidates[:neighbourhood_size])
+
+
+def reroster(
+    instance,
+    assignment,
+    changes,
+    window=None,
+    neighbourhood_size=2,
+    sequence_engine="table",
+    cache_dir=DEFAULT_CACHE_DIR,
+    history_mode="variables",
+    solver_profile=None,
+    incumbent_callback=None,
+    fairness_days=None,
+    fairness_decay=1.0,
+):
+    """Re-roster an existing assignment after staff changes.
+
+    Only shifts of affected staff within the window of days are
+    re-optimised. If that neighbourhood is infeasible it is widened to
+    the whole period, then to all staff.
+    """
+    num_days = instance["num_days"]
+    changed_staff = set(changes.get("unavailable", {})) | set(
+        changes.get("new_staff", {})
+    )
+    changed_roles = {
+        role
+        for staff_member in changes.get("removed_staff", ())
+        for role in instance["staff"][staff_member]
+    }
+    instance, assignment = apply_roster_changes(instance, assignment, changes)
+    staff = instance["staff"]
+    for staff_member in changed_staff:
+        changed_roles.update(staff[staff_member])
+    if window is None:
+        window = get_reroster_window(changes, num_days)
+    affected_staff = get_affected_staff(
+        instance, assignment, changed_staff, changed_roles, neighbourhood_size
+    )
+    window_days = set(range(window[0], window[1] + 1))
+    all_days = set(range(1, num_days + 1))
+    neighbourhoods = []
+    for neighbourhood in (
+        (affected_staff, window_days),
+        (affected_staff, all_days),
+        (set(staff), all_days),
+    ):
+        if neighbourhood not in neighbourhoods:
+            neighbourhoods.append(neighbourhood)
+    for free_staff, free_days in neighbourhoods:
+        log.info(
+            f"Re-rostering {len(free_staff)} staff over {len(free_days)} days"
+        )
+        roster_model = build_model_cached(
+            instance,
+            sequence_engine=sequence_engine,
+            cache_dir=cache_dir,
+            history_mode=history_mode,
+            hint_assignment=assignment,
+            # Locked shifts treat interchangeable staff differently
+            symmetry_breaking=False,
+            fairness_days=fairness_days,
+            fairness_decay=fairness_decay,
+        )
+        enforce_unavailability(
+            changes.get("unavailable", {}),
+            roster_model.shift_calendar,
+            roster_model.model,
+            roster_model.work_vars,
+        )
+        locked_days = {
+            staff_member: sorted(
+                all_days
+                if staff_member not in free_staff
+                else all_days - free_days
+            )
+            for staff_member in staff
+        }
+        enforce_locked_shifts(
+            assignment,
+            locked_days,
+            roster_model.shift_calendar,
+            roster_model.model,
+            roster_model.work_vars,
+        )
+        try:
+            solver = solve(
+                roster_model.model, solver_profile, incumbent_callback
+            )
+        except SolutionNotFeasible:
+            log.info("Neighbourhood infeasible, widening...")
+            continue
+        return roster_model, solver
+    raise SolutionNotFeasible("No feasible solutions.")
+
+
+if __name__ == "__main__":
+    setup_logging()
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "solution",
+        help="JSON file mapping staff to their existing list of shifts",
+    )
+    parser.add_argument(
+        "changes",
+        help="JSON file of unavailable, new_staff and removed_staff changes",
+    )
+    parser.add_argument(
+        "--window",
+        type=int,
+        nargs=2,
+        metavar=("FIRST_DAY", "LAST_DAY"),
+        help="days that can change, defaults to first changed day onwards",
+    )
+    parser.add_argument(
+        "--neighbourhood-size",
+        type=int,
+        default=2,
+        help="number of unchanged staff sharing a role that can change",
+    )
+    add_instance_arguments(parser)
+    add_model_arguments(parser)
+    add_solver_arguments(parser)
+    add_output_arguments(parser)
+    args = parser.parse_args()
+    with open(args.solution) as solution_file:
+        assignment = json.load(solution_file)
+    with open(args.changes) as changes_file:
+        changes = json.load(changes_file)
+    roster_model, solver = reroster(
+        get_instance(args),
+        assignment,
+        changes,
+        window=args.window,
+        neighbourhood_size=args.neighbourhood_size,
+        sequence_engine=args.sequence_engine,
+        cache_dir=None if args.no_cache else args.cache_dir,
+        history_mode=args.history_mode,
+        solver_profile=get_solver_profile(args),
+        fairness_days=args.fairness_days,
+        fairness_decay=args.fairness_decay,
+    )
+    result = RosterResult.from_solver(roster_model, solver)
+    result.display_by_staff()
+    write_result(result, get_output_paths(args))
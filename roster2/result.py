@@ -0,0 +1,180 @@
+"""Solved roster2 rosters and their text, CSV and JSON renderings."""
+import csv
+import json
+
+import numpy as np
+
+from compact import DAY_OFF, CompactInstance
+
+
+class RosterResult:
+    """Shifts worked by each staff member on each day as an array.
+
+    shift_codes has a row per staff member and a column per day of the
+    roster period.
+    """
+
+    def __init__(
+        self,
+        staff,
+        shifts,
+        shift_codes,
+        max_unpleasant_shifts=None,
+        previous_shifts=None,
+    ):
+        self.staff = list(staff)
+        self.shifts = list(shifts)
+        self.shift_codes = shift_codes
+        self.max_unpleasant_shifts = max_unpleasant_shifts
+        self.previous_shifts = previous_shifts
+
+    @classmethod
+    def from_solver(cls, roster_model, solver):
+        """Extract result of a solved roster model in one pass."""
+        return cls.from_solution(
+            roster_model, solver.ResponseProto().solution
+        )
+
+    @classmethod
+    def from_solution(cls, roster_model, solution):
+        """Extract result from values of all variables of a roster model.
+
+        This also works in solution callbacks, which have a response
+        but are not solvers.
+        """
+        instance = roster_model.instance
+        work_var_indexes = roster_model.work_var_indexes
+        solution = np.array(solution, dtype=np.int64)
+        worked = (work_var_indexes >= 0) & (
+            solution[np.maximum(work_var_indexes, 0)] == 1
+        )
+        # At most one shift is worked per day
+        shift_codes = (
+            worked * np.arange(1, work_var_indexes.shape[2] + 1)
+        ).max(axis=2, initial=0)
+        return cls(
+            instance["staff"],
+            instance["shifts"],
+            shift_codes.astype(np.int8),
+            int(solution[roster_model.max_unpleasant_shifts.Index()]),
+            instance["previous_shifts"],
+        )
+
+    @classmethod
+    def from_assignment(
+        cls, instance, assignment, max_unpleasant_shifts=None
+    ):
+        """Get result from shifts worked by each staff member."""
+        return cls(
+            instance["staff"],
+            instance["shifts"],
+            CompactInstance(
+                {**instance, "previous_shifts": assignment}
+            ).history,
+            max_unpleasant_shifts,
+            instance["previous_shifts"],
+        )
+
+    @property
+    def num_days(self):
+        """Number of days in roster period."""
+        return self.shift_codes.shape[1]
+
+    def get_shift_names(self):
+        """Get array of shift names indexed by shift code."""
+        return np.array([DAY_OFF] + self.shifts, dtype=object)
+
+    def get_distance(self, other):
+        """Count staff days on which two rosters have different shifts."""
+        return int(np.count_nonzero(self.shift_codes != other.shift_codes))
+
+    def get_assignment(self):
+        """Get shifts worked by each staff member on each day.
+
+        This can be used as previous_shifts for the next roster period
+        or as a solution hint.
+        """
+        shift_names = self.get_shift_names()
+        return {
+            staff_member: shift_names[shift_codes].tolist()
+            for staff_member, shift_codes in zip(
+                self.staff, self.shift_codes
+            )
+        }
+
+    def display_by_staff(self):
+        """Display shifts by staff."""
+        shift_names = self.get_shift_names()
+        lines = [
+            f"{staff_member}: "
+            + "".join(f"{shift:2} " for shift in shift_names[shift_codes])
+            for staff_member, shift_codes in zip(
+                self.staff, self.shift_codes
+            )
+        ]
+        print("\n".join(lines))
+        if self.max_unpleasant_shifts is not None:
+            print(
+                f"Maximum unpleasant shifts over previous "
+                f"and current period is {self.max_unpleasant_shifts}"
+            )
+
+    def display_by_day(self):
+        """Display shifts by day, including the previous period."""
+        shift_names = self.get_shift_names()
+        lines = []
+        if self.previous_shifts is not None:
+            for day in range(1 - self.num_days, 1):
+                line = f"Day {day}: "
+                for shift in self.shifts:
+                    working = [
+                        staff_member
+                        for staff_member in self.staff
+                        if self.previous_shifts[staff_member][day - 1] == shift
+                    ]
+                    if working:
+                        line += f"{shift}: " + "".join(
+                            f"{staff_member} " for staff_member in working
+                        )
+                lines.append(line)
+        for day in range(1, self.num_days + 1):
+            line = f"Day {day}: "
+            day_codes = self.shift_codes[:, day - 1]
+            for code in np.unique(day_codes[day_codes > 0]):
+                line += f"{shift_names[code]}: " + "".join(
+                    f"{self.staff[row]} "
+                    for row in np.flatnonzero(day_codes == code)
+                )
+            lines.append(line)
+        print("\n".join(lines))
+
+    def write_csv(self, path):
+        """Write shifts as CSV with a row per staff member."""
+        shift_names = self.get_shift_names()
+        with open(path, "w", newline="") as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(["staff"] + list(range(1, self.num_days + 1)))
+            for staff_member, shift_codes in zip(
+                self.staff, self.shift_codes
+            ):
+                writer.writerow(
+                    [staff_member] + shift_names[shift_codes].tolist()
+                )
+
+    def write_json(self, path):
+        """Write shifts and objective as JSON."""
+        with open(path, "w") as json_file:
+            json.dump(
+                {
+                    "num_days": self.num_days,
+                    "shifts": self.shifts,
+                    "max_unpleasant_shifts": self.max_unpleasant_shifts,
+                    "roster": self.get_assignment(),
+                },
+                json_file,
+            )
+
+    def write_previous_shifts(self, path):
+        """Write shifts as JSON previous_shifts for the next period."""
+        with open(path, "w") as json_file:
+            json.dump(self.get_assignment(), json_file)
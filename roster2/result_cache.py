@@ -0,0 +1,112 @@
+"""Cache of solved roster2 rosters in front of model build and solve.
+
+Results are keyed by a hash of the instance, build options and solver
+profile, held in memory with least recently used eviction and persisted
+as one file per result so they survive restarts.
+"""
+import glob
+import json
+import logging
+import os
+from collections import OrderedDict
+
+import ortools
+
+from cache import get_cache_path, get_input_hash, write_cache_file
+
+log = logging.getLogger("roster")
+
+# Increment when the stored result format or the models results come
+# from change so stale results are not returned
+RESULT_CACHE_VERSION = 1
+
+DEFAULT_MAX_RESULTS = 128
+
+
+def get_result_cache_key(instance, solver_profile, **build_options):
+    """Get cache key for the result of solving instance."""
+    return get_input_hash(
+        RESULT_CACHE_VERSION,
+        ortools.__version__,
+        instance,
+        solver_profile or {},
+        build_options,
+    )
+
+
+class ResultCache:
+    """Least recently used cache of solved rosters.
+
+    Each result is a dict with the "assignment", "max_unpleasant_shifts"
+    and solver "status". If cache_dir is given results are also stored
+    there, last used order being kept by file modification times, and
+    are read back when first requested. hits and misses count lookups.
+    """
+
+    def __init__(self, cache_dir=None, max_results=DEFAULT_MAX_RESULTS):
+        self.cache_dir = cache_dir
+        self.max_results = max_results
+        self.hits = 0
+        self.misses = 0
+        # Results not yet read from disk are None
+        self.results = OrderedDict()
+        if cache_dir is not None:
+            paths = glob.glob(get_cache_path(cache_dir, "result", "*"))
+            for path in sorted(paths, key=os.path.getmtime):
+                key = os.path.basename(path)[len("result-") : -len(".bin")]
+                self.results[key] = None
+            self.evict()
+
+    def get(self, key):
+        """Get cached result, or None if there is none."""
+        if key not in self.results:
+            self.misses += 1
+            return None
+        result = self.results[key]
+        if self.cache_dir is not None:
+            path = get_cache_path(self.cache_dir, "result", key)
+            try:
+                if result is None:
+                    with open(path, "rb") as result_file:
+                        result = json.loads(result_file.read())
+                    self.results[key] = result
+                else:
+                    os.utime(path)
+            except FileNotFoundError:
+                # Removed by another process
+                del self.results[key]
+                self.misses += 1
+                return None
+        self.results.move_to_end(key)
+        self.hits += 1
+        return result
+
+    def put(self, key, result):
+        """Store result, evicting the least recently used if full."""
+        self.results[key] = result
+        self.results.move_to_end(key)
+        if self.cache_dir is not None:
+            write_cache_file(
+                get_cache_path(self.cache_dir, "result", key),
+                json.dumps(result).encode(),
+            )
+        self.evict()
+
+    def evict(self):
+        """Remove least recently used results beyond max_results."""
+        while len(self.results) > self.max_results:
+            key, _ = self.results.popitem(last=False)
+            if self.cache_dir is not None:
+                try:
+                    os.unlink(get_cache_path(self.cache_dir, "result", key))
+                except FileNotFoundError:
+                    pass
+            log.debug(f"Evicted result {key}")
+
+    def get_stats(self):
+        """Get hit and miss counts and number of cached results."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "results": len(self.results),
+        }
@@ -1,107 +1,500 @@
 """Mini roster 2."""
+import argparse
+import json
 import logging
-from ortools.sat.python import cp_model
-
-from data import (
-    num_days,
-    shifts,
-    staff,
-    shift_days,
-    previous_shifts,
-    valid_shift_sequences,
-    skill_mix_rules,
-    unpleasant_shifts,
-)
+import os
 
-from logic import (
-    create_previous_shift_vars,
-    create_shift_vars,
-    create_skill_mix_vars,
-    display_shifts_by_staff,
-    enforce_shifts_already_worked,
-    enforce_skill_mix_rules,
-    enforce_one_skill_mix_rule_per_shift,
-    enforce_shift_sequences,
-    get_valid_shift_sequence_permutations,
-    solve,
-    enforce_completion_of_shift_segments,
-    configure_objective,
+from builder import (
+    HISTORY_MODES,
+    SEQUENCE_ENGINES,
+    build_model,
+    get_default_instance,
+)
+from cache import DEFAULT_CACHE_DIR, get_input_hash
+from decompose import solve_decomposed
+from feasibility import check_instance, diagnose_infeasibility
+from loader import load_instance
+from logic import SolutionNotFeasible, load_solver_profile, solve
+from model_cache import build_model_cached
+from result import RosterResult
+from result_cache import (
+    DEFAULT_MAX_RESULTS,
+    ResultCache,
+    get_result_cache_key,
 )
+from solution_pool import enumerate_diverse_rosters
+from telemetry import SolveTelemetry
 
 log = logging.getLogger("roster")
-logging.basicConfig(
-    level=logging.DEBUG, format="%(asctime)s %(levelname)5s: %(message)s"
-)
 
 
-def main():
-    """Run main program."""
-    model = cp_model.CpModel()
-    previous_shift_vars = create_previous_shift_vars(
-        num_days, model, shifts, staff, shift_days
-    )
-    shift_vars = create_shift_vars(
-        previous_shift_vars, model, staff, shifts, shift_days
-    )
-    enforce_shifts_already_worked(
-        staff, previous_shifts, shifts, shift_days, model, shift_vars, num_days
-    )
-    days_in_partial_sequence = 7
-    valid_shift_sequence_permutations = get_valid_shift_sequence_permutations(
-        valid_shift_sequences,
-        days_in_partial_sequence,
-        num_days,
-        shift_days,
-        shifts,
-    )
-    enforce_shift_sequences(
-        staff,
-        shift_vars,
-        shifts,
-        shift_days,
-        num_days,
-        model,
-        valid_shift_sequence_permutations,
-    )
-    skill_mix_vars = create_skill_mix_vars(
-        model, shifts, shift_days, skill_mix_rules
-    )
-    enforce_one_skill_mix_rule_per_shift(
-        shifts, shift_days, skill_mix_vars, skill_mix_rules, model
-    )
-    enforce_skill_mix_rules(
-        shifts,
-        skill_mix_rules,
-        shift_days,
-        model,
-        shift_vars,
-        staff,
-        skill_mix_vars,
-    )
-    enforce_completion_of_shift_segments(
-        valid_shift_sequences,
-        days_in_partial_sequence,
-        previous_shifts,
-        shift_vars,
-        model,
-        staff,
-        shift_days,
-        shifts,
-    )
-    max_unpleasant_shifts = configure_objective(
-        model, shift_vars, staff, unpleasant_shifts, num_days, shift_days,
+def main(
+    sequence_engine="table",
+    cache_dir=DEFAULT_CACHE_DIR,
+    history_mode="variables",
+    solver_profile=None,
+    incumbent_callback=None,
+    hint_assignment=None,
+    build_report_path=None,
+    decompose=False,
+    max_processes=None,
+    symmetry_breaking=True,
+    output_paths=None,
+    instance=None,
+    fairness_days=None,
+    fairness_decay=1.0,
+    screen=True,
+    diagnose=False,
+    pool_size=None,
+    min_distance=1,
+    objective_tolerance=0,
+    result_cache=None,
+    telemetry_path=None,
+    metrics_path=None,
+):
+    """Run main program.
+
+    hint_assignment is an existing assignment of shifts per staff member
+    and day used to warm start the solver. The model build report is
+    logged and, if build_report_path is given, written there as JSON.
+    With decompose, independent sub-rosters are solved in up to
+    max_processes worker processes, without hints or incumbent callbacks.
+    output_paths maps "csv", "json" and "previous_shifts" to files the
+    roster is written to in those formats. The instance defaults to the
+    one in data.py. Fairness counts unpleasant shifts over the last
+    fairness_days days of history, decayed by fairness_decay per earlier
+    roster period. With screen, instances failing the feasibility
+    screen are rejected before a model is built. With diagnose, the
+    build stages whose constraints conflict are logged if the model is
+    infeasible. With pool_size, up to that many rosters within
+    objective_tolerance of the best, each differing from the others on
+    at least min_distance staff days, are displayed and written to
+    numbered output files. If a ResultCache is given, a roster solved
+    before with the same inputs is taken from it without building or
+    solving, and new rosters are stored in it. Decomposed rosters and
+    pools are not cached. Solver telemetry is appended to the JSONL
+    file telemetry_path and written as Prometheus text metrics to
+    metrics_path, labelled with a hash of the instance and the build
+    options. Decomposed rosters have no telemetry.
+    """
+    if decompose and pool_size is not None:
+        raise ValueError("Solution pools cannot be decomposed")
+    if instance is None:
+        instance = get_default_instance()
+    result_cache_key = None
+    if result_cache is not None and not decompose and pool_size is None:
+        result_cache_key = get_result_cache_key(
+            instance,
+            solver_profile,
+            sequence_engine=sequence_engine,
+            history_mode=history_mode,
+            hint_assignment=hint_assignment,
+            symmetry_breaking=symmetry_breaking,
+            fairness_days=fairness_days,
+            fairness_decay=fairness_decay,
+        )
+        cached_result = result_cache.get(result_cache_key)
+        if cached_result is not None:
+            log.info(f"Using cached {cached_result['status']} result")
+            result = RosterResult.from_assignment(
+                instance,
+                cached_result["assignment"],
+                cached_result["max_unpleasant_shifts"],
+            )
+            result.display_by_staff()
+            write_result(result, output_paths)
+            return
+    if screen:
+        check_instance(instance)
+    if decompose:
+        assignment, max_unpleasant_shifts, build_reports = solve_decomposed(
+            instance,
+            sequence_engine=sequence_engine,
+            cache_dir=cache_dir,
+            history_mode=history_mode,
+            solver_profile=solver_profile,
+            max_processes=max_processes,
+            symmetry_breaking=symmetry_breaking,
+            fairness_days=fairness_days,
+            fairness_decay=fairness_decay,
+        )
+        result = RosterResult.from_assignment(
+            instance, assignment, max_unpleasant_shifts
+        )
+        result.display_by_staff()
+        write_result(result, output_paths)
+        if build_report_path is not None:
+            with open(build_report_path, "w") as report_file:
+                json.dump(
+                    {"sub_rosters": build_reports}, report_file, indent=2
+                )
+        return
+    roster_model = build_model_cached(
+        instance,
+        sequence_engine=sequence_engine,
+        cache_dir=cache_dir,
+        history_mode=history_mode,
+        hint_assignment=hint_assignment,
+        symmetry_breaking=symmetry_breaking,
+        fairness_days=fairness_days,
+        fairness_decay=fairness_decay,
     )
+    telemetry = None
+    if telemetry_path is not None or metrics_path is not None:
+        telemetry = SolveTelemetry(
+            {
+                "instance": get_input_hash(instance)[:16],
+                "sequence_engine": sequence_engine,
+                "history_mode": history_mode,
+            }
+        )
     log.info("Starting solver....")
-    solver = solve(model)
-    display_shifts_by_staff(
-        num_days,
-        shifts,
-        shift_days,
-        staff,
-        shift_vars,
-        solver,
-        max_unpleasant_shifts,
+    try:
+        if pool_size is None:
+            solver = solve(
+                roster_model.model,
+                solver_profile,
+                incumbent_callback,
+                telemetry,
+            )
+            results = [RosterResult.from_solver(roster_model, solver)]
+        else:
+            results = enumerate_diverse_rosters(
+                roster_model,
+                pool_size,
+                min_distance,
+                objective_tolerance,
+                solver_profile,
+                telemetry,
+            )
+    except SolutionNotFeasible:
+        if diagnose:
+            if roster_model.build_report.stages[0]["stage"] == (
+                "load_cached_model"
+            ):
+                # Cached models have no constraint groups to diagnose
+                roster_model = build_model(
+                    instance,
+                    sequence_engine=sequence_engine,
+                    cache_dir=cache_dir,
+                    history_mode=history_mode,
+                    hint_assignment=hint_assignment,
+                    symmetry_breaking=symmetry_breaking,
+                    fairness_days=fairness_days,
+                    fairness_decay=fairness_decay,
+                )
+            diagnose_infeasibility(roster_model, solver_profile)
+        raise
+    finally:
+        if telemetry is not None and telemetry.record is not None:
+            if telemetry_path is not None:
+                telemetry.write_jsonl(telemetry_path)
+            if metrics_path is not None:
+                telemetry.write_metrics(metrics_path)
+    for number, result in enumerate(results, start=1):
+        if pool_size is None:
+            result.display_by_staff()
+            write_result(result, output_paths)
+        else:
+            print(f"Roster {number}:")
+            result.display_by_staff()
+            write_result(
+                result, get_numbered_output_paths(output_paths, number)
+            )
+    if result_cache_key is not None:
+        result_cache.put(
+            result_cache_key,
+            {
+                "assignment": results[0].get_assignment(),
+                "max_unpleasant_shifts": results[0].max_unpleasant_shifts,
+                "status": solver.StatusName(solver.ResponseProto().status),
+            },
+        )
+    build_report = roster_model.build_report.to_dict()
+    roster_model.build_report.log_report(build_report)
+    if build_report_path is not None:
+        roster_model.build_report.write(build_report_path, build_report)
+
+
+def write_result(result, output_paths=None):
+    """Write roster result to files by format."""
+    for output_format, path in (output_paths or {}).items():
+        if output_format == "csv":
+            result.write_csv(path)
+        elif output_format == "json":
+            result.write_json(path)
+        elif output_format == "previous_shifts":
+            result.write_previous_shifts(path)
+        else:
+            raise ValueError(f"Unknown output format: {output_format}")
+
+
+def get_numbered_output_paths(output_paths, number):
+    """Get output paths for one roster of a pool, e.g. roster_2.csv."""
+    numbered_output_paths = {}
+    for output_format, path in (output_paths or {}).items():
+        root, extension = os.path.splitext(path)
+        numbered_output_paths[output_format] = f"{root}_{number}{extension}"
+    return numbered_output_paths
+
+
+def add_output_arguments(parser):
+    """Add command line arguments for writing rosters."""
+    parser.add_argument("--csv", help="write roster as CSV to this file")
+    parser.add_argument("--json", help="write roster as JSON to this file")
+    parser.add_argument(
+        "--previous-shifts",
+        help="write roster as JSON previous_shifts for the next period",
+    )
+
+
+def get_output_paths(args):
+    """Get output paths by format from command line arguments."""
+    output_paths = {
+        "csv": args.csv,
+        "json": args.json,
+        "previous_shifts": args.previous_shifts,
+    }
+    return {
+        output_format: path
+        for output_format, path in output_paths.items()
+        if path is not None
+    }
+
+
+def add_instance_arguments(parser):
+    """Add command line arguments for choosing the roster instance."""
+    parser.add_argument(
+        "--instance",
+        help="directory to load the instance from instead of data.py",
+    )
+
+
+def get_instance(args):
+    """Get roster instance from command line arguments.
+
+    Enough history is loaded for the fairness window.
+    """
+    if args.instance is None:
+        return get_default_instance()
+    return load_instance(args.instance, args.fairness_days)
+
+
+def add_model_arguments(parser):
+    """Add command line arguments for building models."""
+    parser.add_argument(
+        "--sequence-engine",
+        choices=SEQUENCE_ENGINES,
+        default="table",
+        help="how shift sequences are enforced",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=DEFAULT_CACHE_DIR,
+        help="directory for cached precomputed tables and models",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="do not read or write cached precomputed tables and models",
+    )
+    parser.add_argument(
+        "--history-mode",
+        choices=HISTORY_MODES,
+        default="variables",
+        help="how the previous roster period is represented in the model",
+    )
+    parser.add_argument(
+        "--no-symmetry-breaking",
+        action="store_true",
+        help="do not order rosters of interchangeable staff members",
+    )
+    parser.add_argument(
+        "--fairness-days",
+        type=int,
+        help="days of history unpleasant shifts are counted over, at "
+        "least and by default the previous roster period",
+    )
+    parser.add_argument(
+        "--fairness-decay",
+        type=float,
+        default=1.0,
+        help="weight of each earlier roster period relative to the next",
     )
 
 
-main()
+def add_solver_arguments(parser):
+    """Add command line arguments for the solver profile."""
+    parser.add_argument(
+        "--solver-profile",
+        help="name of a saved solver profile the other solver options "
+        "override",
+    )
+    parser.add_argument(
+        "--num-workers",
+        type=int,
+        help="number of parallel search workers, 0 uses all cores",
+    )
+    parser.add_argument(
+        "--max-time", type=float, help="solver time limit in seconds"
+    )
+    parser.add_argument(
+        "--relative-gap",
+        type=float,
+        help="stop when objective is within this relative gap of the bound",
+    )
+    parser.add_argument("--random-seed", type=int, help="solver random seed")
+    parser.add_argument(
+        "--log-search-progress",
+        action="store_true",
+        help="log solver search progress",
+    )
+    parser.add_argument(
+        "--repair-hint",
+        action="store_true",
+        help="let the solver repair an infeasible hint",
+    )
+
+
+def get_solver_profile(args):
+    """Get solver profile from command line arguments."""
+    saved_solver_profile = (
+        {}
+        if args.solver_profile is None
+        else load_solver_profile(args.solver_profile)
+    )
+    solver_profile = {
+        "num_workers": args.num_workers,
+        "max_time_in_seconds": args.max_time,
+        "relative_gap_limit": args.relative_gap,
+        "random_seed": args.random_seed,
+        "log_search_progress": args.log_search_progress or None,
+        "repair_hint": args.repair_hint or None,
+    }
+    return {
+        **saved_solver_profile,
+        **{
+            parameter: value
+            for parameter, value in solver_profile.items()
+            if value is not None
+        },
+    }
+
+
+def setup_logging():
+    """Configure logging for command line programs."""
+    logging.basicConfig(
+        level=logging.DEBUG, format="%(asctime)s %(levelname)5s: %(message)s"
+    )
+
+
+if __name__ == "__main__":
+    setup_logging()
+    parser = argparse.ArgumentParser(description=__doc__)
+    add_instance_arguments(parser)
+    add_model_arguments(parser)
+    add_solver_arguments(parser)
+    add_output_arguments(parser)
+    parser.add_argument(
+        "--hint",
+        help="warm start from 'previous' shifts or a JSON file mapping "
+        "staff to a list of shifts per day",
+    )
+    parser.add_argument(
+        "--build-report", help="write model build report as JSON to this file"
+    )
+    parser.add_argument(
+        "--decompose",
+        action="store_true",
+        help="solve independent sub-rosters in parallel processes",
+    )
+    parser.add_argument(
+        "--max-processes",
+        type=int,
+        help="maximum number of processes for --decompose",
+    )
+    parser.add_argument(
+        "--no-screen",
+        action="store_true",
+        help="do not screen the instance for infeasibility before building",
+    )
+    parser.add_argument(
+        "--diagnose",
+        action="store_true",
+        help="log the conflicting constraint groups of infeasible models",
+    )
+    parser.add_argument(
+        "--pool-size",
+        type=int,
+        help="find up to this many diverse rosters near the best",
+    )
+    parser.add_argument(
+        "--min-distance",
+        type=int,
+        default=1,
+        help="staff days on which each pair of pooled rosters must differ",
+    )
+    parser.add_argument(
+        "--objective-tolerance",
+        type=int,
+        default=0,
+        help="how far above the best objective pooled rosters may be",
+    )
+    parser.add_argument(
+        "--result-cache",
+        action="store_true",
+        help="reuse rosters solved before with the same inputs",
+    )
+    parser.add_argument(
+        "--max-cached-results",
+        type=int,
+        default=DEFAULT_MAX_RESULTS,
+        help="number of rosters kept by --result-cache",
+    )
+    parser.add_argument(
+        "--telemetry", help="append solver telemetry as JSONL to this file"
+    )
+    parser.add_argument(
+        "--metrics",
+        help="write solver telemetry as Prometheus text metrics to this file",
+    )
+    args = parser.parse_args()
+    instance = get_instance(args)
+    if args.hint is None:
+        hint_assignment = None
+    elif args.hint == "previous":
+        hint_assignment = instance["previous_shifts"]
+    else:
+        with open(args.hint) as hint_file:
+            hint_assignment = json.load(hint_file)
+    result_cache = None
+    if args.result_cache:
+        result_cache = ResultCache(
+            None if args.no_cache else args.cache_dir,
+            args.max_cached_results,
+        )
+    main(
+        sequence_engine=args.sequence_engine,
+        cache_dir=None if args.no_cache else args.cache_dir,
+        history_mode=args.history_mode,
+        solver_profile=get_solver_profile(args),
+        hint_assignment=hint_assignment,
+        build_report_path=args.build_report,
+        decompose=args.decompose,
+        max_processes=args.max_processes,
+        symmetry_breaking=not args.no_symmetry_breaking,
+        output_paths=get_output_paths(args),
+        instance=instance,
+        fairness_days=args.fairness_days,
+        fairness_decay=args.fairness_decay,
+        screen=not args.no_screen,
+        diagnose=args.diagnose,
+        pool_size=args.pool_size,
+        min_distance=args.min_distance,
+        objective_tolerance=args.objective_tolerance,
+        result_cache=result_cache,
+        telemetry_path=args.telemetry,
+        metrics_path=args.metrics,
+    )
+    if result_cache is not None:
+        log.info(f"Result cache {result_cache.get_stats()}")
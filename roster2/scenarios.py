@@ -0,0 +1,268 @@
+"""Batch what-if scenarios for mini roster 2.
+
+Each scenario is a base instance plus a delta. Scenarios are solved in
+parallel worker processes and compared by feasibility, objective and
+solve time.
+"""
+import argparse
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from builder import DAYS_IN_PARTIAL_SEQUENCE, INSTANCE_KEYS
+from cache import DEFAULT_CACHE_DIR, get_input_hash
+from feasibility import screen_instance
+from logic import (
+    create_solver,
+    get_process_solver_profile,
+    get_valid_shift_sequence_permutations,
+)
+from model_cache import build_model_cached
+from reroster import apply_roster_changes
+from roster import (
+    add_instance_arguments,
+    add_model_arguments,
+    add_solver_arguments,
+    get_instance,
+    get_solver_profile,
+    setup_logging,
+)
+from shift_calendar import ShiftCalendar
+
+log = logging.getLogger("roster")
+
+# Instance keys whose deltas update individual entries rather than
+# replacing the whole value
+MERGED_INSTANCE_KEYS = (
+    "staff",
+    "shift_days",
+    "previous_shifts",
+    "skill_mix_rules",
+)
+
+
+def apply_scenario(instance, scenario):
+    """Get the instance for a scenario.
+
+    A scenario may contain any instance key. Values for staff,
+    shift_days, previous_shifts and skill_mix_rules update those
+    entries, other values replace the base value.
+    "extra_valid_shift_sequences" are added to the valid shift
+    sequences, and "new_staff" and "removed_staff" change staff as in
+    re-rostering.
+    """
+    instance = dict(instance)
+    for key in INSTANCE_KEYS:
+        if key not in scenario:
+            continue
+        if key in MERGED_INSTANCE_KEYS:
+            instance[key] = {**instance[key], **scenario[key]}
+        else:
+            instance[key] = scenario[key]
+    instance["valid_shift_sequences"] = list(
+        instance["valid_shift_sequences"]
+    ) + list(scenario.get("extra_valid_shift_sequences", ()))
+    instance, _ = apply_roster_changes(instance, {}, scenario)
+    return instance
+
+
+def precompute_shift_sequence_permutations(instances, cache_dir):
+    """Write the permutation table of each distinct instance to the cache.
+
+    Worker processes then load shared tables instead of each computing
+    them.
+    """
+    keys = set()
+    for instance in instances:
+        shift_calendar = ShiftCalendar(
+            instance["num_days"], instance["shifts"], instance["shift_days"]
+        )
+        key = get_input_hash(
+            instance["valid_shift_sequences"],
+            DAYS_IN_PARTIAL_SEQUENCE,
+            instance["num_days"],
+            shift_calendar.shift_days,
+            shift_calendar.shifts,
+        )
+        if key in keys:
+            continue
+        keys.add(key)
+        get_valid_shift_sequence_permutations(
+            instance["valid_shift_sequences"],
+            DAYS_IN_PARTIAL_SEQUENCE,
+            instance["num_days"],
+            shift_calendar,
+            cache_dir=cache_dir,
+        )
+    log.info(f"Precomputed {len(keys)} shift sequence permutation tables")
+
+
+def run_scenario(
+    name,
+    instance,
+    sequence_engine,
+    cache_dir,
+    history_mode,
+    solver_profile,
+    symmetry_breaking,
+    fairness_days,
+    fairness_decay,
+):
+    """Build and solve one scenario, returning its result.
+
+    Scenarios failing the feasibility screen are not built.
+    """
+    result = {"scenario": name}
+    try:
+        problems = screen_instance(instance)
+        if problems:
+            result["status"] = "INFEASIBLE"
+            result["problems"] = problems
+            return result
+        start_time = time.perf_counter()
+        roster_model = build_model_cached(
+            instance,
+            sequence_engine=sequence_engine,
+            cache_dir=cache_dir,
+            history_mode=history_mode,
+            symmetry_breaking=symmetry_breaking,
+            fairness_days=fairness_days,
+            fairness_decay=fairness_decay,
+        )
+        result["build_time"] = time.perf_counter() - start_time
+        solver = create_solver(solver_profile)
+        start_time = time.perf_counter()
+        solution_status = solver.Solve(roster_model.model)
+        result["solve_time"] = time.perf_counter() - start_time
+        result["status"] = solver.StatusName(solution_status)
+        if result["status"] in ("OPTIMAL", "FEASIBLE"):
+            result["objective"] = solver.Value(
+                roster_model.max_unpleasant_shifts
+            )
+            result["best_bound"] = solver.BestObjectiveBound()
+    except Exception as error:
+        result["status"] = "ERROR"
+        result["error"] = repr(error)
+    return result
+
+
+def run_scenarios(
+    base_instance,
+    scenarios,
+    sequence_engine="table",
+    cache_dir=DEFAULT_CACHE_DIR,
+    history_mode="variables",
+    solver_profile=None,
+    max_processes=None,
+    symmetry_breaking=True,
+    fairness_days=None,
+    fairness_decay=1.0,
+):
+    """Solve scenarios of a base instance in parallel processes.
+
+    Each scenario is a delta for apply_scenario with a "name" and an
+    optional "max_time_in_seconds" overriding the solver profile time
+    limit. Returns one result per scenario, in order.
+    """
+    instances = [
+        apply_scenario(base_instance, scenario) for scenario in scenarios
+    ]
+    if sequence_engine == "table" and cache_dir is not None:
+        precompute_shift_sequence_permutations(instances, cache_dir)
+    num_processes = max(
+        1, min(len(scenarios), max_processes or os.cpu_count() or 1)
+    )
+    solver_profile = get_process_solver_profile(
+        solver_profile, num_processes
+    )
+    with ProcessPoolExecutor(max_workers=num_processes) as executor:
+        futures = [
+            executor.submit(
+                run_scenario,
+                scenario.get("name", f"scenario{num + 1}"),
+                instance,
+                sequence_engine,
+                cache_dir,
+                history_mode,
+                {
+                    **solver_profile,
+                    "max_time_in_seconds": scenario.get(
+                        "max_time_in_seconds",
+                        solver_profile.get("max_time_in_seconds"),
+                    ),
+                },
+                symmetry_breaking,
+                fairness_days,
+                fairness_decay,
+            )
+            for num, (scenario, instance) in enumerate(
+                zip(scenarios, instances)
+            )
+        ]
+        return [future.result() for future in futures]
+
+
+def display_comparison(results):
+    """Display a table comparing scenario results."""
+    name_width = max(
+        len("Scenario"), *(len(result["scenario"]) for result in results)
+    )
+    print(
+        f"{'Scenario':{name_width}} {'Status':10} {'Objective':>9} "
+        f"{'Bound':>7} {'Build':>8} {'Solve':>8}"
+    )
+    for result in results:
+        objective = result.get("objective")
+        best_bound = result.get("best_bound")
+        print(
+            f"{result['scenario']:{name_width}} {result['status']:10} "
+            f"{'-' if objective is None else objective:>9} "
+            f"{'-' if best_bound is None else round(best_bound):>7} "
+            f"{result.get('build_time', 0):7.2f}s "
+            f"{result.get('solve_time', 0):7.2f}s"
+        )
+
+
+if __name__ == "__main__":
+    setup_logging()
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "scenarios",
+        help="JSON file with a list of scenario deltas of the instance, "
+        "each with a name",
+    )
+    parser.add_argument(
+        "--no-base",
+        action="store_true",
+        help="do not include the unchanged base instance",
+    )
+    parser.add_argument(
+        "--max-processes", type=int, help="maximum number of processes"
+    )
+    parser.add_argument("--output", help="write results as JSON to this file")
+    add_instance_arguments(parser)
+    add_model_arguments(parser)
+    add_solver_arguments(parser)
+    args = parser.parse_args()
+    with open(args.scenarios) as scenarios_file:
+        scenarios = json.load(scenarios_file)
+    if not args.no_base:
+        scenarios = [{"name": "base"}] + scenarios
+    results = run_scenarios(
+        get_instance(args),
+        scenarios,
+        sequence_engine=args.sequence_engine,
+        cache_dir=None if args.no_cache else args.cache_dir,
+        history_mode=args.history_mode,
+        solver_profile=get_solver_profile(args),
+        max_processes=args.max_processes,
+        symmetry_breaking=not args.no_symmetry_breaking,
+        fairness_days=args.fairness_days,
+        fairness_decay=args.fairness_decay,
+    )
+    display_comparison(results)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
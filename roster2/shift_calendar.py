@@ -0,0 +1,53 @@
+"""Calendar index of shifts and days for roster2."""
+
+
+class ShiftCalendar:
+    """Index of the days on which each shift runs.
+
+    Built once from num_days and shift_days. Days 1 to num_days are the
+    current roster period and days 1 - num_days to 0 are the previous
+    period, which mirrors the current one.
+    """
+
+    def __init__(self, num_days, shifts, shift_days):
+        self.num_days = num_days
+        self.shifts = list(shifts)
+        self.shift_days = {
+            shift: tuple(sorted(shift_days[shift])) for shift in shifts
+        }
+        self._shift_day_sets = {
+            shift: frozenset(days) for shift, days in self.shift_days.items()
+        }
+        self._previous_shift_days = {
+            shift: tuple(day - num_days for day in days)
+            for shift, days in self.shift_days.items()
+        }
+        shifts_on_day = [[] for _ in range(num_days + 1)]
+        for shift in shifts:
+            for day in self.shift_days[shift]:
+                shifts_on_day[day].append(shift)
+        self._shifts_on_day = tuple(
+            tuple(shifts_for_day) for shifts_for_day in shifts_on_day
+        )
+
+    def current_day(self, day):
+        """Map a previous period day onto the matching current period day."""
+        if day < 1:
+            return day + self.num_days
+        return day
+
+    def days(self, shift):
+        """Days in the current period on which shift runs."""
+        return self.shift_days[shift]
+
+    def previous_days(self, shift):
+        """Days in the previous period on which shift runs."""
+        return self._previous_shift_days[shift]
+
+    def shifts_on_day(self, day):
+        """Shifts running on day, in shifts order."""
+        return self._shifts_on_day[self.current_day(day)]
+
+    def runs_on(self, shift, day):
+        """Whether shift runs on day."""
+        return self.current_day(day) in self._shift_day_sets[shift]
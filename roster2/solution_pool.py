@@ -0,0 +1,121 @@
+"""Pools of diverse near optimal rosters for mini roster 2.
+
+The model is solved once for its best maximum unpleasant shifts. A copy
+with the objective replaced by a bound of that value plus a tolerance
+is then searched in a single enumerating solver run, keeping each
+roster that differs from every roster already kept on at least
+min_distance staff days until the pool is full.
+"""
+import logging
+
+from ortools.sat.python import cp_model
+
+from logic import (
+    create_solver,
+    get_unpleasant_shift_weights_by_code,
+    solve,
+)
+from result import RosterResult
+
+log = logging.getLogger("roster")
+
+
+class DiverseSolutionCallback(cp_model.CpSolverSolutionCallback):
+    """Keep enumerated rosters far enough from those already kept.
+
+    Search stops once num_solutions rosters are kept.
+    """
+
+    def __init__(self, roster_model, results, num_solutions, min_distance):
+        cp_model.CpSolverSolutionCallback.__init__(self)
+        self.roster_model = roster_model
+        self.results = results
+        self.num_solutions = num_solutions
+        self.min_distance = min_distance
+        self.num_enumerated = 0
+
+    def on_solution_callback(self):
+        """Handle enumerated solution."""
+        self.num_enumerated += 1
+        result = RosterResult.from_solution(
+            self.roster_model, self.response_proto.solution
+        )
+        if all(
+            result.get_distance(kept) >= self.min_distance
+            for kept in self.results
+        ):
+            self.results.append(result)
+            log.info(
+                f"Kept roster {len(self.results)} of {self.num_enumerated} "
+                f"enumerated after {self.WallTime():.2f}s"
+            )
+            if len(self.results) >= self.num_solutions:
+                self.StopSearch()
+
+
+def get_max_unpleasant_shifts(roster_model, result):
+    """Get maximum unpleasant shifts of a roster of a roster model.
+
+    Unpleasant shifts in the roster are added to the counts before the
+    roster period that the objective uses.
+    """
+    compact_instance = roster_model.compact_instance
+    weights_by_code = get_unpleasant_shift_weights_by_code(
+        compact_instance, roster_model.instance["unpleasant_shifts"]
+    )
+    counts = weights_by_code[result.shift_codes].sum(axis=1)
+    return int(
+        max(
+            roster_model.previous_unpleasant_shift_counts[staff_member]
+            + count
+            for staff_member, count in zip(compact_instance.staff, counts)
+        )
+    )
+
+
+def enumerate_diverse_rosters(
+    roster_model,
+    num_solutions,
+    min_distance=1,
+    objective_tolerance=0,
+    solver_profile=None,
+    telemetry=None,
+):
+    """Get up to num_solutions diverse rosters near the best objective.
+
+    Rosters are within objective_tolerance of the best maximum
+    unpleasant shifts found and each pair differs on at least
+    min_distance staff days. The best roster comes first. Enumeration
+    runs on one worker, and fewer rosters are returned if the search
+    ends before the pool is full. Raises SolutionNotFeasible if the
+    model is infeasible. A SolveTelemetry records the search for the
+    best roster.
+    """
+    solver = solve(roster_model.model, solver_profile, telemetry=telemetry)
+    results = [RosterResult.from_solver(roster_model, solver)]
+    if num_solutions > 1:
+        model = roster_model.model.Clone()
+        model.ClearObjective()
+        model.Add(
+            model.GetIntVarFromProtoIndex(
+                roster_model.max_unpleasant_shifts.Index()
+            )
+            <= results[0].max_unpleasant_shifts + objective_tolerance
+        )
+        pool_solver = create_solver(solver_profile)
+        pool_solver.parameters.enumerate_all_solutions = True
+        pool_solver.parameters.num_workers = 1
+        pool_solver.Solve(
+            model,
+            DiverseSolutionCallback(
+                roster_model, results, num_solutions, max(1, min_distance)
+            ),
+        )
+        # Without an objective the bound is not tight, so evaluate each
+        # enumerated roster directly
+        for result in results[1:]:
+            result.max_unpleasant_shifts = get_max_unpleasant_shifts(
+                roster_model, result
+            )
+    log.info(f"Found {len(results)} diverse rosters")
+    return results
@@ -0,0 +1,164 @@
+"""Synthetic roster instance generators for benchmarking.
+
+Instances are built around a planted cyclic roster so they are always
+feasible. Staff rotate week by week through the 7-day blocks of the
+valid shift sequences, and skill mix rules are derived from the role
+counts the planted roster produces.
+"""
+import random
+
+
+def get_shift_sequences(num_weekday_shifts, num_weekend_shifts):
+    """Get shifts and valid shift sequences for synthetic instances.
+
+    Each weekday shift has a 7-day sequence and each weekend shift has a
+    14-day sequence paired with a weekday shift.
+    """
+    weekday_shifts = [f"D{num}" for num in range(1, num_weekday_shifts + 1)]
+    weekend_shifts = [f"E{num}" for num in range(1, num_weekend_shifts + 1)]
+    valid_shift_sequences = [
+        [shift] * 5 + ["X", "X"] for shift in weekday_shifts
+    ]
+    for num, weekend_shift in enumerate(weekend_shifts):
+        shift = weekday_shifts[num % num_weekday_shifts]
+        valid_shift_sequences.append(
+            [shift] * 4
+            + ["X", weekend_shift, weekend_shift]
+            + ["X"]
+            + [shift] * 4
+            + ["X", "X"]
+        )
+    return weekday_shifts + weekend_shifts, valid_shift_sequences
+
+
+def get_planted_roster(
+    staff_offsets, valid_shift_sequences, first_week, weeks
+):
+    """Get shifts of a cyclic roster for a range of weeks.
+
+    Each staff member works the 7-day block at their offset plus the week
+    number in the rotation of all sequence blocks.
+    """
+    rotation = [
+        valid_shift_sequence[start : start + 7]
+        for valid_shift_sequence in valid_shift_sequences
+        for start in range(0, len(valid_shift_sequence), 7)
+    ]
+    return {
+        staff_member: [
+            shift
+            for week in range(first_week, first_week + weeks)
+            for shift in rotation[(offset + week) % len(rotation)]
+        ]
+        for staff_member, offset in staff_offsets.items()
+    }
+
+
+def generate_instance(
+    num_staff=9,
+    num_days=28,
+    num_weekday_shifts=3,
+    num_weekend_shifts=2,
+    num_roles=1,
+    multi_role_fraction=0.0,
+    seed=0,
+):
+    """Generate a feasible roster2 instance.
+
+    num_days must be a multiple of 7. A fraction of staff members are
+    given a second role.
+    """
+    if num_days % 7 != 0:
+        raise ValueError("Number of days must be a multiple of 7.")
+    rng = random.Random(seed)
+    weeks = num_days // 7
+    shifts, valid_shift_sequences = get_shift_sequences(
+        num_weekday_shifts, num_weekend_shifts
+    )
+    roles = [f"role{num}" for num in range(1, num_roles + 1)]
+
+    staff = {}
+    staff_offsets = {}
+    for num in range(num_staff):
+        staff_member = f"S{num + 1}"
+        role = roles[num % num_roles]
+        staff[staff_member] = [role]
+        if num_roles > 1 and rng.random() < multi_role_fraction:
+            staff[staff_member].append(
+                rng.choice([other for other in roles if other != role])
+            )
+        # Spread staff of each role evenly through the rotation
+        staff_offsets[staff_member] = num // num_roles
+
+    previous_shifts = get_planted_roster(
+        staff_offsets, valid_shift_sequences, -weeks, weeks
+    )
+    planted_shifts = get_planted_roster(
+        staff_offsets, valid_shift_sequences, 0, weeks
+    )
+
+    weekdays_for_shift = {shift: set() for shift in shifts}
+    for valid_shift_sequence in valid_shift_sequences:
+        for position, shift in enumerate(valid_shift_sequence):
+            if shift != "X":
+                weekdays_for_shift[shift].add(position % 7)
+    shift_days = {
+        shift: [
+            day
+            for day in range(1, num_days + 1)
+            if (day - 1) % 7 in weekdays_for_shift[shift]
+        ]
+        for shift in shifts
+    }
+
+    skill_mix_rules = {}
+    for shift in shifts:
+        rules = []
+        for day in shift_days[shift]:
+            rule = {role: 0 for role in roles}
+            for staff_member in staff:
+                if planted_shifts[staff_member][day - 1] == shift:
+                    rule[staff[staff_member][0]] += 1
+            if rule not in rules:
+                rules.append(rule)
+        skill_mix_rules[shift] = tuple(rules)
+
+    return {
+        "num_days": num_days,
+        "shifts": shifts,
+        "staff": staff,
+        "shift_days": shift_days,
+        "previous_shifts": previous_shifts,
+        "valid_shift_sequences": valid_shift_sequences,
+        "skill_mix_rules": skill_mix_rules,
+        "unpleasant_shifts": shifts[num_weekday_shifts - 1 :],
+    }
+
+
+def scale_roster1_instance(base_instance, num_copies=1, num_periods=1):
+    """Scale a roster1 instance by copying staff and repeating shifts.
+
+    Every copy of a staff member can mirror the original's shifts and the
+    shifts repeat each period, so a feasible base instance stays
+    feasible. Supervisors are not copied.
+    """
+    staff = {}
+    for copy in range(num_copies):
+        for staff_member, groups in base_instance["staff"].items():
+            name = staff_member if copy == 0 else f"{staff_member}{copy}"
+            staff[name] = groups
+    return {
+        "staff": staff,
+        "num_shifts": base_instance["num_shifts"] * num_periods,
+        "max_staff": base_instance["max_staff"] * num_copies,
+        "min_staff": base_instance["min_staff"] * num_copies,
+        "days_per_roster": {
+            group: days * num_periods
+            for group, days in base_instance["days_per_roster"].items()
+        },
+        "groups_together": {
+            group: days * num_periods
+            for group, days in base_instance["groups_together"].items()
+        },
+        "supervisors": base_instance["supervisors"],
+    }
@@ -0,0 +1,251 @@
+"""Solver search telemetry for roster2.
+
+A SolveTelemetry follows one solve through incumbent and best bound
+callbacks and the solver response: the objective and bound timeline,
+time to first solution, search counters and presolve statistics. Each
+solve can be appended to a JSONL file and the latest written as a
+Prometheus text format metrics file.
+"""
+import json
+import logging
+import re
+import time
+
+from cache import write_file_atomically
+
+log = logging.getLogger("roster")
+
+# Search counters copied from the solver response
+RESPONSE_COUNTERS = (
+    "num_conflicts",
+    "num_branches",
+    "num_binary_propagations",
+    "num_integer_propagations",
+    "num_restarts",
+    "num_lp_iterations",
+)
+
+# Prometheus metric name, record key and help text of each gauge
+METRICS = (
+    ("wall_seconds", "wall_time", "Solver wall time"),
+    ("user_seconds", "user_time", "Solver user time"),
+    ("deterministic_time", "deterministic_time", "Solver deterministic time"),
+    (
+        "first_solution_seconds",
+        "time_to_first_solution",
+        "Time to the first feasible roster",
+    ),
+    ("objective", "objective", "Best maximum unpleasant shifts found"),
+    ("best_bound", "best_bound", "Best bound on maximum unpleasant shifts"),
+    ("incumbents", "num_incumbents", "Improving rosters found"),
+    ("conflicts", "num_conflicts", "Search conflicts"),
+    ("branches", "num_branches", "Search branches"),
+    ("binary_propagations", "num_binary_propagations", "Binary propagations"),
+    (
+        "integer_propagations",
+        "num_integer_propagations",
+        "Integer propagations",
+    ),
+    ("restarts", "num_restarts", "Search restarts"),
+    ("lp_iterations", "num_lp_iterations", "LP iterations"),
+    ("gap_integral", "gap_integral", "Integral of the optimality gap"),
+    ("presolve_seconds", "presolve_time", "Presolve wall time"),
+    ("timestamp_seconds", "timestamp", "Unix time the solve finished"),
+)
+
+METRIC_PREFIX = "roster_solve_"
+
+
+def parse_count(text):
+    """Parse a solver log count such as 1'369."""
+    return int(text.replace("'", ""))
+
+
+def parse_presolve_log(solve_log):
+    """Get model sizes before and after presolve from a solve log.
+
+    Returns a dict with initial_variables, initial_constraints,
+    presolved_variables and presolved_constraints, and presolve_time
+    in seconds, leaving out those the log does not show.
+    """
+    presolve = {}
+    section = None
+    start_times = {}
+    for line in solve_log.splitlines():
+        if line.startswith("Initial optimization model"):
+            section = "initial"
+        elif line.startswith("Presolved optimization model"):
+            section = "presolved"
+        elif line.startswith("#Variables:") and section is not None:
+            presolve[f"{section}_variables"] = parse_count(
+                line.split()[1]
+            )
+            presolve[f"{section}_constraints"] = 0
+        elif line.startswith("#k") and section is not None:
+            presolve[f"{section}_constraints"] += parse_count(
+                line.split()[1]
+            )
+        elif line.strip() == "":
+            section = None
+        match = re.match(r"Starting (presolve|search) at ([\d.]+)s", line)
+        if match:
+            start_times[match.group(1)] = float(match.group(2))
+            section = None
+    if "presolve" in start_times and "search" in start_times:
+        presolve["presolve_time"] = (
+            start_times["search"] - start_times["presolve"]
+        )
+    return presolve
+
+
+def format_label_value(value):
+    """Escape a Prometheus label value."""
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace('"', '\\"')
+        .replace("\n", "\\n")
+    )
+
+
+class SolveTelemetry:
+    """Search progress and statistics of one solve.
+
+    labels, such as an instance hash, are written with the record and
+    on each metric so slow solves can be traced to their inputs.
+    """
+
+    def __init__(self, labels=None):
+        self.labels = dict(labels or {})
+        self.timeline = []
+        self.record = None
+        self.start_time = None
+
+    def attach(self, solver):
+        """Have solver report bounds and its log to the telemetry.
+
+        Call before solving, passing improving solutions to
+        on_incumbent. The search log is kept in the response rather
+        than printed unless log_search_progress was already set.
+        """
+        if not solver.parameters.log_search_progress:
+            solver.parameters.log_to_stdout = False
+        solver.parameters.log_search_progress = True
+        solver.parameters.log_to_response = True
+        solver.best_bound_callback = self.on_best_bound
+        self.timeline = []
+        self.start_time = time.perf_counter()
+
+    def on_incumbent(self, callback):
+        """Record an improving solution."""
+        self.timeline.append(
+            {
+                "time": time.perf_counter() - self.start_time,
+                "event": "incumbent",
+                "objective": callback.ObjectiveValue(),
+                "bound": callback.BestObjectiveBound(),
+            }
+        )
+
+    def on_best_bound(self, bound):
+        """Record an improved objective bound."""
+        self.timeline.append(
+            {
+                "time": time.perf_counter() - self.start_time,
+                "event": "bound",
+                "bound": bound,
+            }
+        )
+
+    def record_response(self, solver):
+        """Record the final status and statistics of the solve."""
+        response = solver.ResponseProto()
+        status = solver.StatusName(response.status)
+        incumbents = [
+            point for point in self.timeline if point["event"] == "incumbent"
+        ]
+        has_solution = status in ("OPTIMAL", "FEASIBLE")
+        self.record = {
+            "timestamp": time.time(),
+            "labels": self.labels,
+            "status": status,
+            "objective": response.objective_value if has_solution else None,
+            "best_bound": response.best_objective_bound,
+            "wall_time": response.wall_time,
+            "user_time": response.user_time,
+            "deterministic_time": response.deterministic_time,
+            "gap_integral": response.gap_integral,
+            "time_to_first_solution": (
+                incumbents[0]["time"] if incumbents else None
+            ),
+            "num_incumbents": len(incumbents),
+            **{
+                counter: getattr(response, counter)
+                for counter in RESPONSE_COUNTERS
+            },
+            "presolve": parse_presolve_log(response.solve_log),
+            "timeline": self.timeline,
+        }
+        log.info(
+            f"Solve telemetry: {status}, {len(incumbents)} incumbents, "
+            f"{response.num_conflicts} conflicts, "
+            f"{response.num_branches} branches"
+        )
+        return self.record
+
+    def write_jsonl(self, path):
+        """Append the record as a line of a JSONL file."""
+        with open(path, "a") as jsonl_file:
+            jsonl_file.write(json.dumps(self.record) + "\n")
+
+    def to_metrics(self):
+        """Get the record in Prometheus text exposition format."""
+        record = {**self.record, **self.record["presolve"]}
+        labels = ",".join(
+            f'{name}="{format_label_value(value)}"'
+            for name, value in sorted(self.labels.items())
+        )
+        lines = []
+
+        def add_metric(name, help_text, values):
+            lines.append(f"# HELP {METRIC_PREFIX}{name} {help_text}")
+            lines.append(f"# TYPE {METRIC_PREFIX}{name} gauge")
+            for extra_labels, value in values:
+                all_labels = ",".join(
+                    label for label in (labels, extra_labels) if label
+                )
+                label_set = f"{{{all_labels}}}" if all_labels else ""
+                lines.append(
+                    f"{METRIC_PREFIX}{name}{label_set} {float(value)}"
+                )
+
+        add_metric(
+            "status",
+            "Solver status of the solve",
+            [(f'status="{record["status"]}"', 1)],
+        )
+        for name, key, help_text in METRICS:
+            if record.get(key) is not None:
+                add_metric(name, help_text, [("", record[key])])
+        for name in ("variables", "constraints"):
+            values = [
+                (f'stage="{stage}"', record[f"{stage}_{name}"])
+                for stage in ("initial", "presolved")
+                if f"{stage}_{name}" in record
+            ]
+            if values:
+                add_metric(
+                    f"model_{name}",
+                    f"Model {name} before and after presolve",
+                    values,
+                )
+        return "\n".join(lines) + "\n"
+
+    def write_metrics(self, path):
+        """Write metrics for a Prometheus textfile collector.
+
+        The file is replaced atomically so it is never read half
+        written, and is readable by a collector running as another
+        user.
+        """
+        write_file_atomically(path, self.to_metrics().encode(), 0o644)